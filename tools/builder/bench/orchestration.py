@@ -0,0 +1,255 @@
+from pathlib import Path
+import json
+import os
+import platform
+import queue
+import shutil
+import statistics
+import subprocess as sp
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from classopt import classopt, config
+
+import build
+from builders.common import BUILD_CACHE_DIR, Builder, Progress
+from utils.artifacts import ArtifactStore
+from utils.manifest import Manifest, toolchain_fingerprint
+from utils.scheduler import Scheduler
+
+
+@classopt(default_long=True)
+class Opt:
+    # Overhead of the Python orchestration layer, measured on a generated vendor tree.
+    # Needs only a C compiler and cmake, nothing is downloaded.
+
+    libraries: int = 8  # Stub CMake dependencies
+    sources: int = 4  # Sources per stub CMake dependency
+    header_deps: int = 2  # Header-only dependencies
+    headers: int = 2000  # Headers per header-only dependency
+    graph: int = 500  # Nodes of the graph the scheduler overhead is measured on
+    repeat: int = 3  # Runs per phase
+    jobs: int = config(long=True, default=os.cpu_count() or 1)  # Parallel builders
+    generator: str = ''  # CMake generator of the end to end builds
+    keep: str = ''  # Generate the tree into this directory and keep it, instead of a temporary one
+    json: str = ''  # Write the results to this file as well
+
+
+CMAKELISTS = '''cmake_minimum_required(VERSION 3.16)
+project({name} C)
+
+add_library({name} STATIC {sources})
+target_include_directories({name} PUBLIC include)
+
+install(TARGETS {name})
+install(DIRECTORY include/ DESTINATION ${{CMAKE_INSTALL_INCLUDEDIR}})
+'''
+
+
+# ==================================================================================================
+# Write a synthetic project below `root`:
+#
+#   vendor/lib<i>       stub CMake projects compiling `sources` trivial C files,
+#                       every odd one requiring the one before it
+#   vendor/headers<i>   header-only dependencies with `headers` headers in nested directories
+#   deps.toml           dependency manifest describing all of them
+#
+# Returns the names of all dependencies.
+# ==================================================================================================
+def generate(root: Path, opt: Opt) -> list[str]:
+    entries: list[str] = []
+    names: list[str] = []
+
+    for i in range(opt.libraries):
+        name = f'lib{i}'
+        source = root / 'vendor' / name
+        (source / 'include' / name).mkdir(parents=True)
+        (source / 'src').mkdir()
+
+        files = []
+        for j in range(opt.sources):
+            (source / 'src' / f'{j}.c').write_text(
+                f'#include "{name}/{name}.h"\nint {name}_{j}(int x) {{ return x + {j}; }}\n')
+            files.append(f'src/{j}.c')
+
+        (source / 'include' / name / f'{name}.h').write_text(f'#pragma once\nint {name}_0(int x);\n')
+        (source / 'CMakeLists.txt').write_text(CMAKELISTS.format(name=name, sources=' '.join(files)))
+
+        requires = f'requires = ["lib{i - 1}"]\n' if i % 2 == 1 else ''
+        entries.append(f'[{name}]\nsource = "vendor/{name}"\nbuild = "cmake"\n{requires}')
+        names.append(name)
+
+    for i in range(opt.header_deps):
+        name = f'headers{i}'
+        include = root / 'vendor' / name / 'include' / name
+        for j in range(opt.headers):
+            path = include / f'{j // 100}' / f'{j}.h'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f'#pragma once\nstatic inline int {name}_{j}(void) {{ return {j}; }}\n')
+
+        entries.append(f'[{name}]\nsource = "vendor/{name}"\nbuild = "headers"\n')
+        names.append(name)
+
+    (root / 'deps.toml').write_text('\n'.join(entries))
+
+    return names
+
+
+# Command line of `build.py` for `action` on the synthetic project
+def build_opt(root: Path, names: list[str], opt: Opt, store: Path, action: str = 'build') -> build.Opt:
+    args = ['--action', action, '--root_path', str(root), '--deps', *names,
+            '--deps_file', str(root / 'deps.toml'), '--jobs', str(opt.jobs),
+            '--cache_dir', str(store), '--launcher', 'none']
+    if opt.generator:
+        args += ['--generator', opt.generator]
+
+    return build.Opt.from_args(args)
+
+
+# Run `build.py` in-process, with its output discarded
+def run_build(root: Path, names: list[str], opt: Opt, store: Path):
+    with open(os.devnull, 'w') as devnull:
+        progress = Progress(queue.Queue(), devnull)
+        progress.start()
+        try:
+            build_options = build_opt(root, names, opt, store)
+            build.run_action(build_options, build.get_all_deps(build_options), root, progress)
+        finally:
+            progress.stop()
+
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def bench_get_all_deps(root: Path, names: list[str], opt: Opt, store: Path) -> float:
+    build_options = build_opt(root, names, opt, store)
+    return timed(build.get_all_deps, build_options)
+
+
+# Stage every header-only dependency into `scratch`, from nothing when `cold`,
+# and again over the previous copy otherwise
+def bench_staging(root: Path, names: list[str], scratch: Path, cold: bool) -> float:
+    if cold:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    start = time.perf_counter()
+    for name in names:
+        if name.startswith('headers'):
+            Builder.copytree(str(root / 'vendor' / name / 'include'), str(scratch / name))
+
+    return time.perf_counter() - start
+
+
+# Hash the sources of every dependency and look its outputs up in the artifact store
+def bench_cache_lookup(root: Path, names: list[str], opt: Opt, store: Path) -> float:
+    deps = build.get_all_deps(build_opt(root, names, opt, store))
+    toolchain = toolchain_fingerprint()
+
+    start = time.perf_counter()
+    hits = 0
+    for dep in deps.values():
+        manifest = Manifest.load(dep.manifest_path)
+        if manifest is None:
+            continue
+
+        current = Manifest.create(dep, deps, manifest.configuration, toolchain)
+        hits += ArtifactStore(store, 0).contains(dep.name, current.key())
+    elapsed = time.perf_counter() - start
+
+    if hits != len(deps):
+        raise RuntimeError(f'expected {len(deps)} artifact store hits, got {hits}')
+
+    return elapsed
+
+
+# Schedule a wide, shallow graph of no-op tasks, returns the overhead per node
+def bench_scheduler(nodes: int, jobs: int) -> float:
+    graph = {f'n{i}': [f'n{j}' for j in (i - 1, i // 2) if 0 <= j < i and i % 3 != 0]
+             for i in range(nodes)}
+
+    start = time.perf_counter()
+    Scheduler(graph, jobs).run(lambda name: None)
+    return (time.perf_counter() - start) / nodes
+
+
+def git_revision() -> str:
+    try:
+        return sp.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                      cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    opt = Opt.from_args()
+
+    if opt.keep:
+        root = Path(opt.keep).resolve()
+        shutil.rmtree(root, ignore_errors=True)
+        root.mkdir(parents=True)
+    else:
+        root = Path(tempfile.mkdtemp(prefix='orchestration-bench-'))
+
+    phases: dict[str, list[float]] = {}
+
+    def record(phase: str, seconds: float):
+        phases.setdefault(phase, []).append(seconds)
+
+    try:
+        names = generate(root, opt)
+        scratch = root / 'scratch'
+
+        for _ in range(opt.repeat):
+            store = root / 'store'
+            shutil.rmtree(root / 'deps', ignore_errors=True)
+            shutil.rmtree(root / BUILD_CACHE_DIR, ignore_errors=True)
+            shutil.rmtree(store, ignore_errors=True)
+
+            record('get_all_deps', bench_get_all_deps(root, names, opt, store))
+            record('stage_headers_cold', bench_staging(root, names, scratch, cold=True))
+            record('stage_headers_noop', bench_staging(root, names, scratch, cold=False))
+            record('scheduler_per_node', bench_scheduler(opt.graph, opt.jobs))
+
+            # ======================================================================================
+            # End to end: compile everything, restore everything from the artifact store,
+            # then rerun with nothing to do
+            # ======================================================================================
+            record('build_cold', timed(run_build, root, names, opt, store))
+            record('cache_lookup', bench_cache_lookup(root, names, opt, store))
+
+            shutil.rmtree(root / 'deps')
+            record('build_from_store', timed(run_build, root, names, opt, store))
+            record('build_noop', timed(run_build, root, names, opt, store))
+    finally:
+        if not opt.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: getattr(opt, key) for key in
+                       ('libraries', 'sources', 'header_deps', 'headers', 'graph', 'repeat', 'jobs')},
+        'phases': {phase: {'median': statistics.median(runs), 'runs': runs}
+                   for phase, runs in phases.items()},
+    }
+
+    print(f'{"phase":<20} {"median":>12} {"min":>12}')
+    for phase, runs in phases.items():
+        unit, scale = ('us', 1e6) if phase == 'scheduler_per_node' else ('ms', 1e3)
+        print(f'{phase:<20} {statistics.median(runs) * scale:>9.2f} {unit} {min(runs) * scale:>9.2f} {unit}')
+
+    if opt.json:
+        Path(opt.json).write_text(json.dumps(results, indent=4))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
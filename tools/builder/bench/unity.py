@@ -0,0 +1,96 @@
+from dataclasses import replace
+from pathlib import Path
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from classopt import classopt, config
+
+from builders.common import Builder, Error
+from utils.registry import create_builder, default_specs_path, load_specs
+from utils.types import BuildOptions, Dependency
+
+
+@classopt(default_long=True)
+class Opt:
+    # Cold build time of CMake dependencies, with and without unity builds
+
+    root_path: str    # Path to project root
+    deps: list[str] = config(long=True, nargs='*', default=[])  # Dependencies, every CMake one if empty
+    repeat: int = 3  # Cold builds per dependency and mode
+    unity_batch: int = 16  # Sources per unity batch
+    pch: bool = False  # Precompile the listed headers in both modes, the projects' own otherwise
+    generator: str = ''  # CMake generator, defaults to Ninja if available
+    json: str = ''  # Write the results to this file as well
+
+
+# Configure and build `name` from scratch into `scratch`, leaving `deps/` and the project's
+# build trees untouched. Returns the wall time of prepare and build, toolchain detection included.
+def cold_build(root: Path, name: str, spec, options: BuildOptions, scratch: Path) -> float:
+    dep = Dependency.create(name, root, spec)
+    dep.target_build_dir = scratch / name / 'build'
+    dep.target_include_dir = scratch / name / 'include'
+
+    options = replace(options, build_cache_dir=scratch / '.buildcache')
+    builder: Builder = create_builder(spec, root, {name: dep}, options)
+
+    start = time.perf_counter()
+    for step in (builder.prepare, builder.build):
+        result = step()
+        if result.error != Error.SUCCESS:
+            raise RuntimeError(result.result)
+
+    return time.perf_counter() - start
+
+
+def main():
+    opt = Opt.from_args()
+    root = Path(opt.root_path).resolve()
+
+    specs = load_specs(default_specs_path())
+    names = opt.deps or [name for name, spec in specs.items() if spec.build == 'cmake']
+
+    results: dict[str, dict[str, list[float]]] = {}
+    for name in names:
+        spec = specs[name]
+        if spec.build != 'cmake':
+            print(f'[{name.upper()}]: not a CMake dependency, skipped', file=sys.stderr)
+            continue
+
+        if not (root / spec.source).exists():
+            print(f'[{name.upper()}]: sources not found, skipped', file=sys.stderr)
+            continue
+
+        results[name] = {}
+        for unity in (False, True):
+            mode = 'unity' if unity else 'default'
+            options = BuildOptions(cpus=os.cpu_count() or 1, generator=opt.generator, unity=unity,
+                                   unity_batch=opt.unity_batch, pch=opt.pch or None)
+
+            # every run starts from an empty build tree, without a toolchain probe
+            times: list[float] = []
+            for _ in range(opt.repeat):
+                with tempfile.TemporaryDirectory(prefix='unity-bench-') as scratch:
+                    times.append(cold_build(root, name, spec, options, Path(scratch)))
+
+            results[name][mode] = times
+
+    print(f'{"dependency":<12} {"default":>10} {"unity":>10} {"speedup":>8}')
+    for name, modes in results.items():
+        default = statistics.median(modes['default'])
+        unity = statistics.median(modes['unity'])
+        print(f'{name:<12} {default:>9.2f}s {unity:>9.2f}s {default / unity:>7.2f}x')
+
+    if opt.json:
+        Path(opt.json).write_text(json.dumps(results, indent=4))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
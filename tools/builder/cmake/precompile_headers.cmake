@@ -0,0 +1,30 @@
+# ==================================================================================================
+# Injected into dependency projects through CMAKE_PROJECT_INCLUDE by the builder.
+# Once the top-level directory has been processed, precompiles TEMPLATE_CPP_PCH_HEADERS
+# for the C++ sources of every library and executable the project defines.
+# ==================================================================================================
+get_property(_template_cpp_pch_deferred GLOBAL PROPERTY TEMPLATE_CPP_PCH_DEFERRED)
+if(_template_cpp_pch_deferred OR NOT TEMPLATE_CPP_PCH_HEADERS)
+    return()
+endif()
+set_property(GLOBAL PROPERTY TEMPLATE_CPP_PCH_DEFERRED TRUE)
+
+function(_template_cpp_precompile_headers directory)
+    get_property(targets DIRECTORY "${directory}" PROPERTY BUILDSYSTEM_TARGETS)
+    foreach(target IN LISTS targets)
+        get_target_property(type ${target} TYPE)
+        if(type MATCHES "^(STATIC_LIBRARY|SHARED_LIBRARY|MODULE_LIBRARY|OBJECT_LIBRARY|EXECUTABLE)$")
+            foreach(header IN LISTS TEMPLATE_CPP_PCH_HEADERS)
+                target_precompile_headers(${target} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:${header}>")
+            endforeach()
+        endif()
+    endforeach()
+
+    get_property(subdirectories DIRECTORY "${directory}" PROPERTY SUBDIRECTORIES)
+    foreach(subdirectory IN LISTS subdirectories)
+        _template_cpp_precompile_headers("${subdirectory}")
+    endforeach()
+endfunction()
+
+cmake_language(DEFER DIRECTORY "${CMAKE_SOURCE_DIR}"
+    CALL _template_cpp_precompile_headers "${CMAKE_SOURCE_DIR}")
@@ -1,65 +1,495 @@
-from utils.types import Dependency
+from utils.types import BuildOptions, Dependency
+from utils.scheduler import Scheduler, split_cpus, weighted_cpus
+from utils.manifest import Manifest, toolchain_fingerprint
+from utils.artifacts import default_store_path
+from utils.sync import STAGE_MODES
+from utils.jobserver import Jobserver
+from utils.trace import Span, summary, write_chrome_trace
+from utils.history import History, history_path
+from utils.memory import MemoryMonitor, link_jobs
+from utils.registry import create_builder, default_specs_path, load_specs
+from utils.bundle import bundle_dir, find_bundle, pack, unpack
+from utils.watch import changed_deps, create_watcher
+from utils.pkgconfig import write_usage_files
+from utils.publish import Publisher
+from utils.remote import WorkerPool
 
-from builders.common import Error, Result
-from builders import *
+from builders.common import Builder, Error, Progress, Result
+from builders.launcher import LAUNCHERS, find_launcher
 
 from classopt import classopt, config
 import colorama
 
-import importlib
+from contextlib import nullcontext
+import queue
 from pathlib import Path
+import os
 import sys
 
 
+# `--pch` values, as `BuildOptions.pch`
+PCH_MODES: dict[str, bool | None] = {'project': None, 'on': True, 'off': False}
+
+
 @classopt(default_long=True)
 class Opt:
     # Describes launch parameters
 
-    action: str       # Action to perform
+    action: str = config(long=True, choices=['build', 'clean', 'pack', 'unpack', 'watch', 'rollback'])  # Action to perform
     root_path: str    # Path to project root
     deps: list[str]   # Dependencies
+    jobs: int = config(long=True, default=os.cpu_count() or 1)  # Job slots shared by all builders
+    force: bool = False  # Rebuild even if the build manifest is up to date
+    cache_dir: str = ''  # Shared artifact store, defaults to ~/.cache/template_cpp-builder
+    cache_size: int = 10240  # Artifact store size limit in MiB
+    no_cache: bool = False  # Don't restore from or publish to the artifact store
+    checksum: bool = False  # Compare header contents instead of size and mtime
+    stage_mode: str = config(long=True, default='copy', choices=STAGE_MODES)  # How headers are staged
+    generator: str = ''  # CMake generator, defaults to Ninja if available
+    unity: bool = False  # Compile CMake dependencies as unity batches
+    unity_batch: int = 16  # Sources per unity batch
+    pch: str = config(long=True, default='project', choices=PCH_MODES)  # Precompile the listed headers (on), none at all (off), or what the project does
+    shared: bool = False  # Build shared libraries
+    lto: bool = False  # Enable link-time optimization
+    no_toolchain_cache: bool = False  # Let every CMake build detect the toolchain itself
+    memory_headroom: int = 512  # MiB of memory kept free, builders wait until their estimated peak fits
+    link_jobs: int = 0  # Concurrent link steps of Ninja builds, picked by available memory if 0
+    launcher: str = config(long=True, default='auto', choices=['auto', 'none', *LAUNCHERS])  # Compiler launcher
+    launcher_dir: str = ''  # Compiler launcher cache, defaults to ~/.cache/template_cpp-<launcher>
+    trace: str = ''  # Write a Chrome trace of all build phases to this file
+    deps_file: str = ''  # Dependency manifest, defaults to tools/builder/deps.toml
+    bundle_dir: str = ''  # Directory or file:// mirror of prebuilt bundles, defaults to deps/.bundles
+    debounce: float = 0.5  # Seconds without changes before watch mode rebuilds
+    poll: bool = False  # Poll for changes instead of using inotify
+    workers: list[str] = config(long=True, nargs='*', default=[])  # Build daemons to farm builds out to, see worker.py
+
+
+def specs_path(opts: Opt) -> Path:
+    return Path(opts.deps_file or default_specs_path())
+
+
+# Actions that need everything the given dependencies (transitively) require,
+# the others only touch the given ones
+REQUIRING_ACTIONS = ['build', 'pack', 'unpack', 'watch']
 
 
 # Acquire a dictionary, with paths pointing to each dependency
+# and everything they (transitively) require, as described by the dependency manifest
 def get_all_deps(opts: Opt) -> dict:
     root_tmp = Path(opts.root_path)
 
     root = root_tmp.resolve()
     deps = {}
-    for dep in opts.deps:
-        if dep == 'bgfx':
-            # add bimg and bgfx
-            deps['bimg'] = Dependency.create('bimg', root)
-            deps['bx'] = Dependency.create('bx', root)
-            deps[dep] = Dependency.create(dep, root)
-        else:
-            deps[dep] = Dependency.create(dep, root)
+
+    specs = load_specs(specs_path(opts))
+
+    pending: list[str] = list(opts.deps)
+    while pending:
+        dep = pending.pop(0)
+        if dep in deps:
+            continue
+
+        if dep not in specs:
+            raise RuntimeError(
+                f'unknown dependency \'{dep}\', known: {", ".join(sorted(specs))}')
+
+        deps[dep] = Dependency.create(dep, root, specs[dep])
+        if opts.action in REQUIRING_ACTIONS:
+            pending.extend(specs[dep].requires)
 
     return deps
 
 
-def add_builder(name: str, opt: Opt, deps: dict, root_path: Path):
-    if name in opt.deps:
-        module = importlib.import_module(f'builders.{name}')
-        builder = getattr(module, f'{name.upper()}Builder')(root_path, deps)
-        if opt.action == 'build':
-            result = builder.prepare()
-            if result.error != Error.SUCCESS:
-                print(result.result)
-                raise RuntimeError(
-                    f'[{name.upper()}]: failed to prepare build')
-
-            result = builder.build()
-            if result.error != Error.SUCCESS:
-                print(result.result)
-                raise RuntimeError(
-                    f'[{name.upper()}]: failed to execute build')
-        elif opt.action == 'clean':
-            result = builder.clean()
-            if result.error != Error.SUCCESS:
-                print(result.result)
-                raise RuntimeError(
-                    f'[{name.upper()}]: failed to execute clean')
+# Prepare and build, raising on the first failing step
+def run_build(builder: Builder):
+    name = builder.name
+
+    with builder.trace('prepare'):
+        result = builder.prepare()
+    if result.error != Error.SUCCESS:
+        builder.log(result.result)
+        raise RuntimeError(
+            f'[{name.upper()}]: failed to prepare build')
+
+    builder.status('building')
+    with builder.trace('build'):
+        result = builder.build()
+    if result.error != Error.SUCCESS:
+        builder.log(result.result)
+        raise RuntimeError(
+            f'[{name.upper()}]: failed to execute build')
+
+
+# Manifest describing what the outputs of `dep` would be built from right now,
+# marks the dependency as built if its current outputs match it
+def current_manifest(builder: Builder, dep: Dependency, deps: dict, toolchain: str) -> Manifest:
+    with builder.trace('manifest'):
+        manifest = Manifest.create(
+            dep, deps, builder.configuration(), toolchain)
+        dep.built = manifest == Manifest.load(dep.manifest_path)
+
+    return manifest
+
+
+# Unpack a bundle built for `key` from `bundles`, returns False if there is none
+def unpack_bundle(builder: Builder, dep: Dependency, key: str, bundles: Path) -> bool:
+    name = dep.name
+
+    path = find_bundle(bundles, name, key)
+    if path is None:
+        return False
+
+    with builder.trace('unpack'):
+        unpacked = unpack(path, dep, key)
+
+    if not unpacked:
+        builder.log(f'[{name.upper()}]: ignoring corrupt bundle \'{str(path)}\'')
+        return False
+
+    builder.log(f'[{name.upper()}]: unpacked {path.name}')
+    return True
+
+
+# Fill the staging copy of a dependency with outputs matching `manifest`, taken from the
+# artifact store, a bundle, or built, on a worker or locally. Returns False if there is nothing to publish.
+def produce_outputs(builder: Builder, staged: Dependency, manifest: Manifest, opt: Opt, bundles: Path | None,
+                    deps: dict, workers: WorkerPool | None) -> bool:
+    name = staged.name
+
+    # ==============================================================================================
+    # Another checkout on this host may have built the same configuration already.
+    # A forced rebuild doesn't trust what's stored, and replaces it once it's done.
+    # ==============================================================================================
+    key = manifest.key()
+    rebuild = opt.force and opt.action != 'unpack'
+
+    if not rebuild:
+        with builder.trace('restore'):
+            restored = builder.restore(key)
+
+        if restored:
+            manifest.save(staged.manifest_path)
+
+            builder.log(f'[{name.upper()}]: restored from artifact store')
+            return True
+
+    # ==============================================================================================
+    # Or someone published a prebuilt bundle of it
+    # ==============================================================================================
+    if bundles is not None and not rebuild and unpack_bundle(builder, staged, key, bundles):
+        return True
+
+    if opt.action == 'unpack':
+        builder.log(f'[{name.upper()}]: no usable bundle for {key[:12]} in \'{str(bundles)}\'')
+        return False
+
+    builder.reset_log()
+
+    # ==============================================================================================
+    # Idle workers take the build off this host, if none can it's built here
+    # ==============================================================================================
+    if workers is not None and staged.spec.build in ('cmake', 'custom'):
+        builder.status('building remotely')
+        try:
+            with builder.trace('remote'):
+                built = workers.build(builder, staged, manifest, deps)
+        finally:
+            builder.status(None)
+
+        if built:
+            with builder.trace('publish'):
+                builder.publish(key, rebuild)
+
+            return True
+
+    local = workers.local if workers is not None else nullcontext()
+    if workers is not None:
+        builder.status('waiting for a local job slot')
+
+    with local:
+        builder.status('preparing')
+        try:
+            run_build(builder)
+        finally:
+            builder.status(None)
+            builder.report_launcher()
+            builder.report_memory()
+
+    builder.record_artifacts()
+    manifest.save(staged.manifest_path)
+
+    with builder.trace('publish'):
+        builder.publish(key, rebuild)
+
+    return True
+
+
+# Run the action for one dependency, returns the timed phases of the builder
+def add_builder(name: str, opt: Opt, deps: dict, root_path: Path, options: BuildOptions, toolchain: str,
+                bundles: Path | None, workers: WorkerPool | None) -> list[Span]:
+    dep: Dependency = deps[name]
+    builder: Builder | None = create_builder(dep.spec, root_path, deps, options)
+    if builder is None:
+        return []
+
+    if opt.action in ('build', 'unpack', 'watch'):
+        # ==========================================================================================
+        # Skip the build entirely if the outputs match the current sources,
+        # toolchain and options
+        # ==========================================================================================
+        manifest = current_manifest(builder, dep, deps, toolchain)
+        if dep.is_built() and not opt.force:
+            builder.log(f'[{name.upper()}]: up to date')
+            return builder.tracer.spans
+
+        # ==========================================================================================
+        # Everything below writes into a staging copy of the outputs, which replaces
+        # the published ones only once it's complete
+        # ==========================================================================================
+        publisher = Publisher(dep)
+        staged: Dependency = publisher.stage()
+        builder.stage(staged)
+        try:
+            produced = produce_outputs(builder, staged, manifest, opt, bundles, deps, workers)
+        except BaseException:
+            publisher.discard(staged)
+            raise
+
+        if not produced:
+            publisher.discard(staged)
+            return builder.tracer.spans
+
+        with builder.trace('swap'):
+            publisher.publish(staged)
+        dep.built = True
+    elif opt.action == 'pack':
+        # ==========================================================================================
+        # Only outputs matching the current configuration are worth sharing
+        # ==========================================================================================
+        manifest = current_manifest(builder, dep, deps, toolchain)
+        if not dep.is_built():
+            raise RuntimeError(
+                f'[{name.upper()}]: not built for the current configuration, build it before packing')
+
+        with builder.trace('pack'):
+            path = pack(dep, manifest.key(), bundles)
+
+        builder.log(f'[{name.upper()}]: packed into \'{str(path)}\'')
+    elif opt.action == 'rollback':
+        if Publisher(dep).rollback():
+            builder.log(f'[{name.upper()}]: rolled back to the previous version')
+        else:
+            builder.log(f'[{name.upper()}]: no previous version to roll back to')
+    elif opt.action == 'clean':
+        dep.manifest_path.unlink(missing_ok=True)
+
+        result = builder.clean()
+        if result.error != Error.SUCCESS:
+            builder.log(result.result)
+            raise RuntimeError(
+                f'[{name.upper()}]: failed to execute clean')
+
+    return builder.tracer.spans
+
+
+# Everything depending on `names`, directly or transitively, including `names` themselves
+def with_dependents(names: set[str], deps: dict) -> set[str]:
+    dependents = Scheduler({name: dep.requires for name, dep in deps.items()}, 1).dependents()
+
+    affected: set[str] = set()
+    pending: list[str] = list(names)
+    while pending:
+        name = pending.pop()
+        if name in affected:
+            continue
+
+        affected.add(name)
+        pending.extend(dependents[name])
+
+    return affected
+
+
+# Run the action for `names` (every dependency if None), independent ones run concurrently
+# and share the available CPUs between them. Returns the timed phases of every builder.
+def run_action(opt: Opt, deps: dict, root_path: Path, progress: Progress, names: set[str] = None) -> list[Span]:
+    selected = [name for name in deps if names is None or name in names]
+
+    # ==============================================================================================
+    # Durations of earlier builds put the longest chain of work first
+    # ==============================================================================================
+    history = History(history_path(root_path))
+    costs: dict[str, float | None] = {name: history.estimate(name) for name in selected}
+
+    # ==============================================================================================
+    # Builders are held back while their peak memory use, as measured before or configured
+    # in `deps.toml`, doesn't fit next to the running ones
+    # ==============================================================================================
+    memory = MemoryMonitor(
+        {name: max(history.memory_estimate(name) or 0, deps[name].spec.memory << 20) for name in selected},
+        opt.memory_headroom << 20, progress.print)
+    buildable = [name for name in selected if deps[name].spec.build != 'source']
+
+    scheduler = Scheduler(
+        {name: [r for r in deps[name].requires if r in selected] for name in selected}, opt.jobs,
+        {name: cost for name, cost in costs.items() if cost is not None},
+        lambda name, running: name not in buildable or memory.admit(name, running))
+    width = min(scheduler.width(), len(buildable))
+
+    # ==============================================================================================
+    # Builds running on workers don't take local job slots, the ones falling back to a local
+    # build still share the `width` slots everything below is sized for
+    # ==============================================================================================
+    toolchain = toolchain_fingerprint()
+    workers: WorkerPool | None = None
+    if opt.workers and opt.action in ('build', 'watch'):
+        workers = WorkerPool(opt.workers, toolchain, width)
+        scheduler.jobs += workers.slots()
+
+    # ==============================================================================================
+    # make and ninja children share `--jobs` slots through a jobserver,
+    # the remaining tools get a share of the CPUs by how long they took before
+    # ==============================================================================================
+    jobserver: Jobserver | None = None
+    if Jobserver.supported():
+        jobserver = Jobserver(opt.jobs, width)
+
+    try:
+        options = BuildOptions(
+            cpus=split_cpus(width),
+            checksum=opt.checksum,
+            stage_mode=opt.stage_mode,
+            generator=opt.generator,
+            unity=opt.unity,
+            unity_batch=opt.unity_batch,
+            pch=PCH_MODES[opt.pch],
+            shared=opt.shared,
+            lto=opt.lto,
+            toolchain_cache=not opt.no_toolchain_cache,
+            link_jobs=opt.link_jobs or link_jobs(opt.jobs),
+            memory=memory,
+            launcher=find_launcher(opt.launcher) or '',
+            launcher_dir=Path(opt.launcher_dir) if opt.launcher_dir else None,
+            jobserver=jobserver.auth() if jobserver is not None else None,
+            cpu_shares=weighted_cpus({name: costs[name] for name in buildable}, width),
+            progress=progress.channel)
+
+        if not opt.no_cache:
+            options.cache_dir = Path(opt.cache_dir or default_store_path())
+            options.cache_size = opt.cache_size << 20
+
+        # ==========================================================================================
+        # Bundles are only looked up during a build if a location was given
+        # ==========================================================================================
+        bundles: Path | None = bundle_dir(opt.bundle_dir) if opt.bundle_dir else None
+        if bundles is None and opt.action in ('pack', 'unpack'):
+            bundles = root_path / 'deps' / '.bundles'
+
+        # ==========================================================================================
+        # Predict what compiling the out of date dependencies takes, nothing is compiled
+        # if none are, or when unpacking
+        # ==========================================================================================
+        building = opt.action in ('build', 'unpack', 'watch')
+        if opt.action in ('build', 'watch'):
+            outdated = outdated_deps(buildable, opt, deps, root_path, options, toolchain)
+            if any(costs[name] is not None for name in outdated):
+                progress.print(prediction(
+                    Scheduler({name: [r for r in deps[name].requires if r in outdated] for name in outdated},
+                              scheduler.jobs, {name: costs[name] for name in outdated if costs[name] is not None}),
+                    [name for name in outdated if costs[name] is None]))
+
+        results = scheduler.run(add_builder, opt, deps, root_path,
+                                options, toolchain, bundles, workers)
+
+        if building:
+            for name, spans in results.items():
+                history.record(name, spans)
+            history.save()
+    finally:
+        if jobserver is not None:
+            jobserver.close()
+
+        # ==========================================================================================
+        # Describe the published outputs to meson, including the ones of builders
+        # that finished before another one failed
+        # ==========================================================================================
+        if opt.action != 'pack':
+            write_usage_files(root_path, load_specs(specs_path(opt)))
+
+    return [span for result in results.values() for span in result]
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f'{seconds:.1f}s'
+
+    return f'{int(seconds // 60)}m {int(seconds % 60):02d}s'
+
+
+# Dependencies among `names` whose outputs don't match what they'd be built from right now
+def outdated_deps(names: list[str], opt: Opt, deps: dict, root_path: Path, options: BuildOptions,
+                  toolchain: str) -> list[str]:
+    outdated: list[str] = []
+    for name in names:
+        builder: Builder | None = create_builder(deps[name].spec, root_path, deps, options)
+        if builder is None:
+            continue
+
+        current_manifest(builder, deps[name], deps, toolchain)
+        if opt.force or not deps[name].is_built():
+            outdated.append(name)
+
+    return outdated
+
+
+# Wall time the scheduler expects the run to take, assuming every dependency is rebuilt
+def prediction(scheduler: Scheduler, unknown: list[str]) -> str:
+    paths = scheduler.critical_paths()
+    chain = scheduler.critical_path()
+
+    text = (f'predicted wall time {format_duration(scheduler.predict())} with {scheduler.jobs} jobs, '
+            f'critical path {" -> ".join(chain)} ({format_duration(paths[chain[0]])})')
+    if unknown:
+        text += f', never built before: {", ".join(unknown)}'
+
+    return text
+
+
+def error_message(re: RuntimeError) -> str:
+    return f'{colorama.Fore.RED}RuntimeError caught: {colorama.Style.BRIGHT}{colorama.Fore.BLUE}{re}{colorama.Style.RESET_ALL}\n'
+
+
+# Rebuild whatever depends on the sources that change below `vendor/`, until interrupted
+def watch(opt: Opt, deps: dict, root_path: Path, progress: Progress):
+    roots = sorted({dep.source_dir for dep in deps.values() if dep.exists()})
+
+    with create_watcher(roots, opt.poll) as watcher:
+        progress.print(f'watching {len(roots)} source trees ({type(watcher).__name__})')
+
+        # ==========================================================================================
+        # An interrupt is the way out of watch mode, ending it successfully
+        # ==========================================================================================
+        try:
+            while True:
+                changed = changed_deps(watcher.wait(opt.debounce), deps)
+                if not changed:
+                    continue
+
+                affected = with_dependents(changed, deps)
+                progress.print(f'changed: {", ".join(sorted(changed))}, rebuilding: {", ".join(sorted(affected))}')
+
+                # ==================================================================================
+                # A broken patch shouldn't end the session, the next change may fix it
+                # ==================================================================================
+                try:
+                    spans = run_action(opt, deps, root_path, progress, affected)
+                except RuntimeError as re:
+                    progress.print(error_message(re))
+                    continue
+
+                if spans:
+                    progress.print(summary(spans))
+        except KeyboardInterrupt:
+            pass
 
 
 def main():
@@ -69,20 +499,42 @@ def main():
     # Parsing launch parameters
     # ==============================================================================================
     opt = Opt.from_args()
-    deps = get_all_deps(opt)
+    root_path: Path = Path(opt.root_path).resolve()
+
+    progress = Progress(queue.Queue())
+    progress.start()
+    try:
+        deps = get_all_deps(opt)
+        spans = run_action(opt, deps, root_path, progress)
+
+        if opt.action == 'watch':
+            if spans:
+                progress.print(summary(spans))
+
+            watch(opt, deps, root_path, progress)
+    except RuntimeError as re:
+        progress.stop()
+        print(error_message(re), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        progress.stop()
+        print('interrupted', file=sys.stderr)
+        return 130
+    finally:
+        if progress.thread.is_alive():
+            progress.stop()
 
     # ==============================================================================================
-    # Create all the builders
+    # Report where the time went
     # ==============================================================================================
-    root_path: Path = Path(opt.root_path).resolve()
-    for dep in deps.keys():
-        try:
-            add_builder(dep, opt, deps, root_path)
-        except RuntimeError as re:
-            print(
-                f'{colorama.Fore.RED}RuntimeError caught: {colorama.Style.BRIGHT}{colorama.Fore.BLUE}{re}{colorama.Style.RESET_ALL}\n', file=sys.stderr)
-            return 1
+    if opt.action == 'build' and spans:
+        print(summary(spans))
+
+    if opt.trace:
+        write_chrome_trace(spans, Path(opt.trace))
+
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
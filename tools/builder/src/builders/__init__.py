@@ -1,8 +1,2 @@
-from .bgfx import BGFXBuilder
-from .fmt import FMTBuilder
-from .glfw3 import GLFW3Builder
-from .sfml import SFMLBuilder
-from .spdlog import SPDLOGBuilder
-
-__all__ = ["BGFXBuilder", "FMTBuilder",
-           "GLFW3Builder", "SFMLBuilder", "SPDLOGBuilder"]
+# Builders are imported on demand by `utils.registry`, so requesting one dependency
+# never imports (or fails on) the builders of all the others
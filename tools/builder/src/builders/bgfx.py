@@ -1,15 +1,13 @@
 from pathlib import Path
-import shutil
 
 from . import common as cm
 import subprocess as sp
 import os
-import shlex
 
 
 class BGFXBuilder(cm.Builder):
-    def __init__(self, root_path: Path, deps: dict):
-        super().__init__(root_path, deps, 'bgfx')
+    def __init__(self, root_path: Path, deps: dict, options: cm.BuildOptions = None):
+        super().__init__(root_path, deps, 'bgfx', options)
 
     def prepare(self) -> cm.Result:
         # ==============================================================================================
@@ -25,7 +23,7 @@ def prepare(self) -> cm.Result:
         if not self.target_include_dir.exists():
             self.target_include_dir.mkdir(parents=True)
 
-        cm.Builder.copytree(self.include_dir, self.target_include_dir)
+        self.stage_headers()
         if not self.target_include_dir.exists():
             msg = f'[BGFX]: failed to transact copy to \'{str(self.target_include_dir)}\''
             return cm.Result(cm.Error.FILE_COPY_FAILED, msg)
@@ -44,72 +42,80 @@ def build(self) -> cm.Result:
             return cm.Result(cm.Error.LINKED_DEP_NOT_FOUND, msg)
 
         # ==============================================================================================
-        # Save current cwd
+        # Run genie from the bgfx source directory to generate the project for this platform
         # ==============================================================================================
-        old_cwd: str = os.getcwd()
+        genie: Path = self.genie_path()
+        if not genie.exists():
+            msg = f'[BGFX]: genie not found at \'{str(genie)}\''
+            return cm.Result(cm.Error.FILE_MISSING, msg)
 
-        # ==============================================================================================
-        # Change cwd to build bgfx
-        # ==============================================================================================
-        cwd: Path = self.deps[self.name].include_dir.parent
-        os.chdir(str(cwd))
+        if self.toolchain.system == 'windows':
+            cmd = [str(genie), 'vs2019']
+        else:
+            cmd = [str(genie), f'--gcc={self.gcc_flavour()}', 'gmake']
 
-        # ==============================================================================================
-        # Run genie
-        # TODO: change platform and genie generation based on OS
-        # ==============================================================================================
-        cmd = shlex.split('../bx/tools/bin/windows/genie vs2019')
-        result: sp.CompletedProcess = sp.run(cmd)
+        with self.trace('configure'):
+            result: sp.CompletedProcess = self.run(cmd, cwd=self.source_dir)
         if result.returncode != 0:
-            msg = f'[BGFX]: genie return code: {result.returncode}'
-            msg += f'\nstdout: {result.stdout}'
-            msg += f'\nstderr: {result.stderr}'
-            return cm.Result(cm.Error.BUILD_TOOL_ERROR, msg)
+            return self.command_error('genie', result)
 
         # ==============================================================================================
-        # Use 'msbuild' to build everything
-        # FIXME: msbuild not used on any platform besides windows
+        # Build everything, with msbuild on windows and make everywhere else
         # ==============================================================================================
-        cmd = shlex.split(
-            'msbuild .build/projects/vs2019/bgfx.sln /clp:ErrorsOnly /p:Configuration="Release" /p:Platform="x64"')
-        result: sp.CompletedProcess = sp.run(cmd)
-        if result.returncode != 0:
-            msg = f'[BGFX]: msbuild return code: {result.returncode}'
-            msg += f'\nstdout: {result.stdout}'
-            msg += f'\nstderr: {result.stderr}'
-            return cm.Result(cm.Error.BUILD_TOOL_ERROR, msg)
+        projects: Path = self.source_dir / '.build' / 'projects'
+        if self.toolchain.system == 'windows':
+            cmd = ['msbuild', str(projects / 'vs2019' / 'bgfx.sln'), f'/m:{self.options.cpus}',
+                   '/clp:ErrorsOnly', '/p:Configuration=Release', '/p:Platform=x64']
+        else:
+            makefiles = sorted(projects.glob('gmake-*/Makefile'))
+            if not makefiles:
+                msg = f'[BGFX]: no generated makefile found in \'{str(projects)}\''
+                return cm.Result(cm.Error.FILE_MISSING, msg)
 
-        # ==============================================================================================
-        # Copy built libraries
-        # FIXME: path depends on os and platform
-        # ==============================================================================================
-        lib_path: Path = self.deps[self.name].include_dir.parent / \
-            '.build' / 'win64_vs2019' / 'bin'
-        if not lib_path.exists():
-            msg = '[BGFX]: path to compiled libraries not found'
-            return cm.Result(cm.Error.FILE_MISSING, msg)
+            cmd = ['make', '-R', '-C', str(makefiles[0].parent), 'config=release64']
+            if self.jobserver_style('make') is None:
+                cmd.append(f'-j{self.options.cpus}')
 
-        # ==============================================================================================
-        # TODO: do this dynamically, rather than hardcoding filenames
-        # ==============================================================================================
-        bgfx_lib_path: Path = lib_path / 'bgfxRelease.lib'
-        bimg_lib_path: Path = lib_path / 'bimgRelease.lib'
-        bx_lib_path: Path = lib_path / 'bxRelease.lib'
-
-        lib_paths = [bgfx_lib_path, bimg_lib_path, bx_lib_path]
-        for lib in lib_paths:
-            if not lib.exists():
-                msg = '[BGFX]: libraries not found'
-                return cm.Result(cm.Error.FILE_MISSING, msg)
+            # genie makefiles compile through CC and CXX, the launcher goes in front of them
+            if self.launcher is not None:
+                cc, cxx = self.compilers()
+                cmd += [f'CC={self.launcher.path} {cc}', f'CXX={self.launcher.path} {cxx}']
 
-            shutil.copy2(lib, self.target_build_dir)
+        with self.trace('compile'):
+            result: sp.CompletedProcess = self.run(cmd, tool=cmd[0])
+        if result.returncode != 0:
+            return self.command_error(cmd[0], result)
 
         # ==============================================================================================
-        # Clean-up, restore old cwd
+        # Copy the release libraries of bgfx, bimg and bx (`artifacts` in `deps.toml`), wherever
+        # genie put them for this platform (e.g. `.build/win64_vs2019/bin`, `.build/linux64_gcc/bin`)
         # ==============================================================================================
-        os.chdir(old_cwd)
+        result = self.collect_libraries(
+            self.source_dir / '.build', self.spec.artifacts)
+        if result.error != cm.Error.SUCCESS:
+            return result
 
         return super().build()
 
+    def genie_path(self) -> Path:
+        host = {'windows': 'windows', 'darwin': 'darwin'}.get(
+            self.toolchain.system, 'linux')
+        suffix = '.exe' if self.toolchain.system == 'windows' else ''
+
+        return self.deps['bx'].source_dir / 'tools' / 'bin' / host / f'genie{suffix}'
+
+    def gcc_flavour(self) -> str:
+        return {'darwin': 'osx-x64'}.get(self.toolchain.system, 'linux-gcc')
+
+    # C and C++ compilers of the genie flavour, unless overridden through the environment
+    def compilers(self) -> tuple[str, str]:
+        cc, cxx = ('clang', 'clang++') if self.toolchain.system == 'darwin' else ('gcc', 'g++')
+
+        return os.environ.get('CC', cc), os.environ.get('CXX', cxx)
+
+    # bgfx is a genie project, the CMake build options don't apply to it
+    def cmake_defines(self) -> dict[str, str]:
+        return {}
+
     def clean(self) -> cm.Result:
         return super().clean()
@@ -0,0 +1,84 @@
+from pathlib import Path
+import shutil
+
+from . import common as cm
+
+
+class CMakeBuilder(cm.Builder):
+    # ==============================================================================================
+    # Builds any plain CMake project described in `deps.toml`, configured with its `options`,
+    # building its `targets` and installing them into the staged outputs
+    # ==============================================================================================
+    def __init__(self, root_path: Path, deps: dict, name: str, options: cm.BuildOptions = None):
+        super().__init__(root_path, deps, name, options)
+
+        self.tag: str = f'[{name.upper()}]'
+
+    def prepare(self) -> cm.Result:
+        # ==============================================================================================
+        # Create build directory, headers are installed (or staged) once the build is done
+        # ==============================================================================================
+        if not self.target_build_dir.exists():
+            self.target_build_dir.mkdir(parents=True)
+
+        if not self.target_build_dir.exists():
+            msg = f'{self.tag}: failed to create directory \'{str(self.target_build_dir)}\''
+            return cm.Result(cm.Error.FILE_MISSING, msg)
+
+        return super().prepare()
+
+    def build(self) -> cm.Result:
+        binary_dir: Path = self.build_tree()
+        binary_dir.mkdir(parents=True, exist_ok=True)
+
+        # ==============================================================================================
+        # Run cmake to generate build configurations, in the build tree kept from the last build.
+        # A tree the configure step fails in may just be broken, so it's retried from scratch.
+        # ==============================================================================================
+        defines = {**self.install_defines(), **self.spec.options}
+        result = self.cmake_configure(binary_dir, defines)
+        if result.error != cm.Error.SUCCESS and (binary_dir / 'CMakeCache.txt').exists():
+            shutil.rmtree(binary_dir)
+            binary_dir.mkdir(parents=True)
+            result = self.cmake_configure(binary_dir, defines)
+        if result.error != cm.Error.SUCCESS:
+            return result
+
+        # ==============================================================================================
+        # Build it with the generator picked by the toolchain
+        # ==============================================================================================
+        result = self.cmake_build(binary_dir, self.spec.targets or None)
+        if result.error != cm.Error.SUCCESS:
+            return result
+
+        # ==============================================================================================
+        # Let the project's install rules pick the libraries, headers and config files
+        # ==============================================================================================
+        result = self.cmake_install(binary_dir)
+        if result.error != cm.Error.SUCCESS:
+            return result
+
+        # ==============================================================================================
+        # Projects without install rules get their libraries collected from the build tree,
+        # and their headers staged from the sources
+        # ==============================================================================================
+        if not self.toolchain.find_libraries(self.target_build_dir):
+            result = self.collect_libraries(binary_dir, self.spec.artifacts)
+            if result.error != cm.Error.SUCCESS:
+                return result
+
+        if not self.target_include_dir.exists():
+            self.stage_headers()
+            if not self.target_include_dir.exists():
+                msg = f'{self.tag}: failed to transact copy to \'{str(self.target_include_dir)}\''
+                return cm.Result(cm.Error.FILE_COPY_FAILED, msg)
+
+        with self.trace('cleanup'):
+            self.prune_build_trees(binary_dir)
+
+        return super().build()
+
+    def clean(self) -> cm.Result:
+        shutil.rmtree(self.build_cache / self.name, ignore_errors=True)
+
+        return super().clean()
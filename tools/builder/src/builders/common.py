@@ -1,9 +1,41 @@
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, replace
 from enum import Enum, auto
-from typing import Any
+from collections import deque
+from hashlib import sha256
+from typing import Any, Callable
+import asyncio
+import fnmatch
+import json
 import os
 import shutil
+import subprocess as sp
+import sys
+import threading
+import time
+
+from builders.launcher import CompilerLauncher, default_launcher_path
+from builders.probe import ToolchainProbe
+from builders.toolchain import Toolchain
+from utils.artifacts import ArtifactStore
+from utils.files import clone_tree
+from utils.fingerprint import hash_file
+from utils.manifest import Artifacts, toolchain_fingerprint
+from utils.memory import PROC, tree_rss
+from utils.sync import SyncStats, resolve_stage_mode, stage_tree, sync_tree
+from utils.trace import Span, Tracer, ninja_log_size, ninja_spans
+from utils.types import BuildOptions, Dependency, DependencySpec
+
+
+# Adds the dependency's `pch` headers to every target of a CMake project
+PRECOMPILE_HEADERS_SCRIPT: Path = Path(
+    __file__).resolve().parent.parent.parent / 'cmake' / 'precompile_headers.cmake'
+
+# Intermediate CMake build trees, kept between runs below the project root
+BUILD_CACHE_DIR = '.buildcache'
+
+# Build trees kept per dependency, one for every recently built configuration
+BUILD_TREES_KEPT = 3
 
 
 class Error(Enum):
@@ -23,34 +55,552 @@ class Result(object):
     result: Any = None
 
 
+class Runner():
+    # ==============================================================================================
+    # Runs a command on an asyncio event loop, streaming stdout and stderr line by line
+    # into `log_path` and `on_line`, and keeping only the last `tail` lines of each in memory
+    # for error reporting. Where `/proc` is available, the resident set size of the command
+    # and its children is sampled every `interval` seconds into `on_sample` and `peak_rss`.
+    # ==============================================================================================
+    def __init__(self, log_path: Path, on_line: Callable[[str], None] = None, tail: int = 50,
+                 on_sample: Callable[[int], None] = None, interval: float = 0.5):
+        self.log_path: Path = log_path
+        self.on_line: Callable[[str], None] | None = on_line
+        self.tail: int = tail
+
+        self.on_sample: Callable[[int], None] | None = on_sample
+        self.interval: float = interval
+        self.peak_rss: int = 0
+
+    def run(self, cmd: list[str], cwd: Path = None, env: dict = None, pass_fds: tuple[int, ...] = ()) -> sp.CompletedProcess:
+        return asyncio.run(self.run_async(cmd, cwd, env, pass_fds))
+
+    async def run_async(self, cmd: list[str], cwd: Path = None, env: dict = None, pass_fds: tuple[int, ...] = ()) -> sp.CompletedProcess:
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(self.log_path, 'a', encoding='utf-8') as log:
+            log.write(f'$ {sp.list2cmdline(cmd)}\n')
+            log.flush()
+
+            process = await asyncio.create_subprocess_exec(
+                *cmd, cwd=cwd, env=env, pass_fds=pass_fds,
+                stdin=sp.DEVNULL, stdout=sp.PIPE, stderr=sp.PIPE, limit=1 << 20)
+
+            sampler = asyncio.create_task(self.sample(process.pid)) if PROC.exists() else None
+
+            stdout: deque = deque(maxlen=self.tail)
+            stderr: deque = deque(maxlen=self.tail)
+            try:
+                await asyncio.gather(
+                    self.pump(process.stdout, stdout, log),
+                    self.pump(process.stderr, stderr, log))
+
+                returncode = await process.wait()
+            finally:
+                if sampler is not None:
+                    sampler.cancel()
+                    if self.on_sample is not None:
+                        self.on_sample(0)
+
+            log.write(f'# return code: {returncode}\n')
+
+        return sp.CompletedProcess(cmd, returncode, '\n'.join(stdout), '\n'.join(stderr))
+
+    async def sample(self, pid: int):
+        while True:
+            rss = tree_rss(pid)
+            self.peak_rss = max(self.peak_rss, rss)
+            if self.on_sample is not None:
+                self.on_sample(rss)
+
+            await asyncio.sleep(self.interval)
+
+    async def pump(self, stream: asyncio.StreamReader, tail: deque, log):
+        while line := await stream.readline():
+            text = line.decode(errors='replace').rstrip('\r\n')
+
+            log.write(text + '\n')
+            tail.append(text)
+            if self.on_line is not None:
+                self.on_line(text)
+
+
+class Progress():
+    # ==============================================================================================
+    # Live status display with one line per running dependency, redrawn in place on a terminal.
+    # Builders send `(name, text, persistent)` messages into `channel` from any thread or
+    # process; persistent messages are printed above the live lines.
+    # ==============================================================================================
+    def __init__(self, channel, stream=None):
+        self.channel = channel
+        self.stream = stream or sys.stdout
+        self.tty: bool = self.stream.isatty()
+
+        self.lines: dict[str, str] = {}
+        self.drawn: int = 0
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.channel.put(None)
+        self.thread.join()
+
+        self.lines.clear()
+        self.draw()
+
+    # Print `text` above the live progress lines
+    def print(self, text: str):
+        self.channel.put(('', text, True))
+
+    def loop(self):
+        while (message := self.channel.get()) is not None:
+            name, text, persistent = message
+            if persistent:
+                self.clear()
+                print(text, file=self.stream)
+            elif text is None:
+                self.lines.pop(name, None)
+            else:
+                self.lines[name] = text
+
+            self.draw()
+
+    def clear(self):
+        if self.tty and self.drawn > 0:
+            self.stream.write(f'\x1b[{self.drawn}F\x1b[J')
+        self.drawn = 0
+
+    def draw(self):
+        if not self.tty:
+            return
+
+        self.clear()
+
+        width = shutil.get_terminal_size().columns - 1
+        for name, text in self.lines.items():
+            line = f'[{name.upper()}] {text}'
+            self.stream.write(line[:width] + '\n')
+
+        self.drawn = len(self.lines)
+        self.stream.flush()
+
+
 class Builder():
+    # Copy a file without writing through `dst`, which may be hardlinked into the artifact store
     @staticmethod
-    def copytree(src, dst, ignore=None):
-        if os.path.isdir(src):
-            if not os.path.isdir(dst):
-                os.makedirs(dst)
-            files = os.listdir(src)
-            if ignore is not None:
-                ignored = ignore(src, files)
-            else:
-                ignored = set()
-            for f in files:
-                if f not in ignored:
-                    Builder.copytree(os.path.join(src, f),
-                                     os.path.join(dst, f), ignore)
-        else:
-            shutil.copyfile(src, dst)
+    def copyfile(src, dst):
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if os.path.lexists(dst):
+            os.unlink(dst)
+
+        shutil.copy2(src, dst)
+
+    # Mirror `src` into `dst`, copying only new or changed files and removing stale ones
+    @staticmethod
+    def copytree(src, dst, ignore=None, checksum: bool = False) -> SyncStats:
+        return sync_tree(src, dst, ignore, checksum)
 
-    def __init__(self, root_path: Path, deps: dict, name: str):
+    def __init__(self, root_path: Path, deps: dict, name: str, options: BuildOptions = None):
         self.root_path: Path = root_path
         self.deps: dict = deps
         self.name: str = name
+        self.options: BuildOptions = options or BuildOptions()
+        if name in self.options.cpu_shares:
+            self.options = replace(self.options, cpus=self.options.cpu_shares[name])
+
+        self.toolchain: Toolchain = Toolchain(self.options.generator)
+        self.toolchain_key: str = toolchain_fingerprint()
+
+        self.store: ArtifactStore | None = None
+        if self.options.cache_dir is not None:
+            self.store = ArtifactStore(
+                self.options.cache_dir, self.options.cache_size)
+
+        if self.name not in self.deps:
+            self.deps[self.name] = Dependency.create(self.name, self.root_path)
+
+        dep: Dependency = self.deps[self.name]
+        self.spec: DependencySpec = dep.spec
+
+        # Where this builder writes its outputs, see `stage`
+        self.outputs: Dependency = dep
+
+        self.source_dir: Path = dep.source_dir
+        self.build_dir: Path = dep.build_dir
+        self.include_dir: Path = dep.include_dir
+
+        self.target_build_dir: Path = dep.target_build_dir
+        self.target_include_dir: Path = dep.target_include_dir
+
+        self.build_cache: Path = self.options.build_cache_dir or self.root_path / BUILD_CACHE_DIR
+
+        self.log_path: Path = dep.target_build_dir.parent / 'logs' / 'build.log'
+        self.runner: Runner = Runner(self.log_path, self.status, on_sample=self.sample_memory)
+        self.tracer: Tracer = Tracer(self.name)
+
+        self.launcher: CompilerLauncher | None = None
+        if self.options.launcher:
+            launcher_dir = self.options.launcher_dir or default_launcher_path(self.options.launcher)
+            self.launcher = CompilerLauncher(
+                self.options.launcher, launcher_dir, self.log_path.parent, self.root_path)
+
+    # Write the outputs into a staging copy of the dependency instead, see `utils.publish`
+    def stage(self, staged: Dependency):
+        self.outputs = staged
+        self.target_build_dir = staged.target_build_dir
+        self.target_include_dir = staged.target_include_dir
+
+    # Time a phase of the build, see `utils.trace`
+    def trace(self, phase: str, **args):
+        return self.tracer.span(phase, **args)
+
+    # Stage the dependency headers into `deps/<name>/include`
+    def stage_headers(self) -> SyncStats:
+        with self.trace('headers'):
+            mode = resolve_stage_mode(
+                self.options.stage_mode, self.include_dir, self.target_include_dir)
+            if mode != self.options.stage_mode:
+                self.log(
+                    f'[{self.name.upper()}]: {self.options.stage_mode} staging not supported, using {mode}')
+
+            if mode != 'symlink':
+                self.seed_headers()
+
+            stats = stage_tree(self.include_dir, self.target_include_dir,
+                               mode, self.options.checksum)
+
+        self.log(f'[{self.name.upper()}]: headers ({mode}): {stats}')
+
+        return stats
+
+    # Staged outputs start out empty, cloning the published headers into them first
+    # means staging only copies what changed since
+    def seed_headers(self):
+        published: Path = self.deps[self.name].target_include_dir.resolve()
+        if published == self.target_include_dir or not published.is_dir() or published.is_symlink():
+            return
+
+        # symlink-staged headers resolve into the sources, there's nothing to clone
+        if published == self.include_dir.resolve():
+            return
+
+        if self.target_include_dir.exists() and any(self.target_include_dir.iterdir()):
+            return
+
+        clone_tree(published, self.target_include_dir)
+
+    # Everything besides sources and toolchain that affects the produced outputs,
+    # changing it invalidates the build manifest
+    def configuration(self) -> dict:
+        # the injected script matters by its contents, not by where this checkout keeps it
+        defines = self.cmake_defines()
+        if 'CMAKE_PROJECT_INCLUDE' in defines:
+            defines['CMAKE_PROJECT_INCLUDE'] = hash_file(PRECOMPILE_HEADERS_SCRIPT)
+
+        return {
+            'builder': type(self).__name__,
+            'options': self.spec.options,
+            'targets': self.spec.targets,
+            'artifacts': self.spec.artifacts,
+            'defines': defines,
+            **self.toolchain.configuration()
+        }
+
+    # ==============================================================================================
+    # Runs every build tool, streaming its output into `deps/<name>/logs/build.log`.
+    # When `tool` is a build tool that understands the jobserver (make, ninja),
+    # the child joins it through `MAKEFLAGS`
+    # ==============================================================================================
+    def jobserver_style(self, tool: str | None) -> str | None:
+        if self.options.jobserver is None:
+            return None
+
+        return Toolchain.jobserver_style(tool)
+
+    def run(self, cmd: list[str], cwd: Path = None, tool: str = None) -> sp.CompletedProcess:
+        env = None
+        pass_fds: tuple[int, ...] = ()
+
+        if self.launcher is not None:
+            env = {**os.environ, **self.launcher.env()}
+
+        style = self.jobserver_style(tool)
+        if style is not None:
+            flags, pass_fds = self.options.jobserver.client(style)
+            env = {**(env or os.environ), **flags}
+
+        return self.runner.run(cmd, cwd, env, pass_fds)
+
+    # Start a fresh log, and fresh compiler launcher statistics, for this run of the builder
+    def reset_log(self):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.log_path.write_text('')
+
+        if self.launcher is not None:
+            self.launcher.reset()
+
+        self.runner.peak_rss = 0
+
+    # Log how many compilations the launcher served from its cache during this run,
+    # and record it for the build summary
+    def report_launcher(self):
+        if self.launcher is None:
+            return
+
+        stats = self.launcher.finish()
+        if stats is None or stats.hits + stats.misses == 0:
+            return
+
+        now = time.time()
+        self.tracer.spans.append(
+            Span(self.name, self.launcher.tool, 'launcher', now, now, 0, asdict(stats)))
+        self.log(f'[{self.name.upper()}]: {self.launcher.tool}: {stats}')
+
+    def sample_memory(self, rss: int):
+        if self.options.memory is not None:
+            self.options.memory.update(self.name, rss)
+
+    # Record the peak memory use of the build tools during this run, for the build summary
+    # and the memory estimates of later runs. The builder no longer counts as running.
+    def report_memory(self):
+        if self.options.memory is not None:
+            self.options.memory.finish(self.name)
+
+        if self.runner.peak_rss == 0:
+            return
+
+        now = time.time()
+        self.tracer.spans.append(
+            Span(self.name, 'peak rss', 'memory', now, now, 0, {'peak': self.runner.peak_rss}))
+
+    def command_error(self, tool: str, result: sp.CompletedProcess) -> Result:
+        msg = f'[{self.name.upper()}]: {tool} return code: {result.returncode}'
+        msg += f'\nstdout: {result.stdout}'
+        msg += f'\nstderr: {result.stderr}'
+        msg += f'\nlog: {str(self.log_path)}'
+        return Result(Error.BUILD_TOOL_ERROR, msg)
+
+    # Print a message about this dependency, above the live progress lines
+    def log(self, msg: str):
+        if self.options.progress is None:
+            print(msg)
+            return
+
+        self.options.progress.put((self.name, msg, True))
+
+    # Replace this dependency's live progress line, None removes it
+    def status(self, line: str | None):
+        if self.options.progress is None:
+            return
+
+        self.options.progress.put((self.name, line, False))
+
+    # ==============================================================================================
+    # Shared CMake steps
+    # ==============================================================================================
+
+    # Cache entries every CMake dependency is configured with, from the build options.
+    # The dependency's own `options` are applied after these and win.
+    def cmake_defines(self) -> dict[str, str]:
+        defines: dict[str, str] = {}
+
+        if self.options.unity and self.spec.unity:
+            defines['CMAKE_UNITY_BUILD'] = 'ON'
+            defines['CMAKE_UNITY_BUILD_BATCH_SIZE'] = str(self.options.unity_batch)
+
+        # ==========================================================================================
+        # Projects may precompile headers of their own, which are left alone unless asked for.
+        # Ours are added to every target through a script that runs after the project has
+        # defined them.
+        # ==========================================================================================
+        if self.options.pch is True:
+            if self.spec.pch:
+                defines['CMAKE_PROJECT_INCLUDE'] = str(PRECOMPILE_HEADERS_SCRIPT)
+                defines['TEMPLATE_CPP_PCH_HEADERS'] = ';'.join(self.spec.pch)
+        elif self.options.pch is False:
+            defines['CMAKE_DISABLE_PRECOMPILE_HEADERS'] = 'ON'
+
+        if self.options.shared:
+            defines['BUILD_SHARED_LIBS'] = 'ON'
+
+        if self.options.lto:
+            defines['CMAKE_INTERPROCEDURAL_OPTIMIZATION'] = 'ON'
+            defines['CMAKE_POLICY_DEFAULT_CMP0069'] = 'NEW'
+
+        return defines
+
+    def cmake_configure(self, build_dir: Path, defines: dict[str, str] = None) -> Result:
+        defines = {**self.cmake_defines(), **(defines or {})}
+
+        # the launcher doesn't change what is built, so it stays out of `cmake_defines`
+        if self.launcher is not None:
+            defines['CMAKE_C_COMPILER_LAUNCHER'] = self.launcher.path
+            defines['CMAKE_CXX_COMPILER_LAUNCHER'] = self.launcher.path
+
+        # ==========================================================================================
+        # Neither does the number of concurrent link steps, which are limited to what
+        # fits into memory. Only Ninja knows job pools.
+        # ==========================================================================================
+        if self.toolchain.build_tool() == 'ninja' and self.options.link_jobs > 0:
+            defines['CMAKE_JOB_POOLS'] = f'link={self.options.link_jobs}'
+            defines['CMAKE_JOB_POOL_LINK'] = 'link'
+
+        initial_cache = self.toolchain_cache(build_dir) if self.options.toolchain_cache else None
+
+        cmd = self.toolchain.configure_command(
+            self.source_dir, build_dir, defines, initial_cache)
+        with self.trace('configure'):
+            result: sp.CompletedProcess = self.run(cmd)
+        if result.returncode != 0:
+            return self.command_error('cmake', result)
+
+        return Result(Error.SUCCESS, None)
+
+    # Reuse the toolchain detection of earlier builds in `build_dir`, see `ToolchainProbe`.
+    # Returns the initial cache to configure with, None to let CMake detect the toolchain itself.
+    def toolchain_cache(self, build_dir: Path) -> Path | None:
+        probe = ToolchainProbe(
+            self.build_cache / 'toolchain', self.toolchain, self.toolchain_key)
+        if probe.ready():
+            ready = probe.ensure(self.run)
+        else:
+            with self.trace('probe'):
+                ready = probe.ensure(self.run)
+
+        if not ready or not probe.seed(build_dir):
+            return None
+
+        return probe.initial_cache
+
+    def cmake_build(self, build_dir: Path, targets: list[str] = None) -> Result:
+        tool = self.toolchain.build_tool()
+        jobserver = self.jobserver_style(tool) is not None
+
+        cmd = self.toolchain.build_command(
+            build_dir, self.options.cpus, targets, jobserver)
+
+        # ==========================================================================================
+        # Ninja records every job it runs, which gives per translation unit compile times
+        # ==========================================================================================
+        offset = ninja_log_size(build_dir)
+        with self.trace('compile'):
+            start = time.time()
+            result: sp.CompletedProcess = self.run(cmd, tool=tool)
+
+        if tool == 'ninja':
+            self.tracer.spans += ninja_spans(build_dir,
+                                             self.name, start, offset)
+
+        if result.returncode != 0:
+            return self.command_error('cmake --build', result)
+
+        return Result(Error.SUCCESS, None)
+
+    # ==============================================================================================
+    # Build tree of the current configuration, `.buildcache/<name>/<config>`. It outlives the
+    # build, apart from the published outputs, so the next build only compiles what changed.
+    # Switching between configurations (e.g. `--unity`) doesn't throw the other trees away.
+    # ==============================================================================================
+    def build_tree(self) -> Path:
+        # a tree configured for another compiler would keep using that one
+        configuration = {**self.configuration(), 'toolchain': self.toolchain_key}
+        config = sha256(json.dumps(configuration, sort_keys=True).encode()).hexdigest()
+        return self.build_cache / self.name / config[:16]
+
+    # Keep the `BUILD_TREES_KEPT` most recently used build trees of the dependency
+    def prune_build_trees(self, used: Path):
+        os.utime(used)
+
+        trees = sorted((tree for tree in used.parent.iterdir() if tree.is_dir()),
+                       key=lambda tree: tree.stat().st_mtime, reverse=True)
+        for tree in trees[BUILD_TREES_KEPT:]:
+            shutil.rmtree(tree, ignore_errors=True)
+
+    # Install the project configured in `build_dir` into the staged outputs,
+    # see `install_defines` for where everything ends up
+    def cmake_install(self, build_dir: Path) -> Result:
+        cmd = self.toolchain.install_command(build_dir, self.target_build_dir.parent)
+        with self.trace('install'):
+            result: sp.CompletedProcess = self.run(cmd)
+        if result.returncode != 0:
+            return self.command_error('cmake', result)
+
+        return Result(Error.SUCCESS, None)
+
+    # ==============================================================================================
+    # Lays an install out like the outputs: libraries (and windows DLLs) in `build`, headers in
+    # `include`, config files below `build/cmake` and `build/pkgconfig`. The prefix is where the
+    # outputs are published, so generated pkg-config files point there.
+    # ==============================================================================================
+    def install_defines(self) -> dict[str, str]:
+        published: Dependency = self.deps[self.name]
+
+        return {
+            'CMAKE_INSTALL_PREFIX': published.target_build_dir.parent.as_posix(),
+            'CMAKE_INSTALL_LIBDIR': 'build',
+            'CMAKE_INSTALL_BINDIR': 'build',
+            'CMAKE_INSTALL_INCLUDEDIR': 'include',
+        }
+
+    # Copy every library matching one of `patterns` (all of them if empty) below `search_dir`
+    # into `deps/<name>/build`, for projects without install rules
+    def collect_libraries(self, search_dir: Path, patterns: list[str] = None) -> Result:
+        libraries = [lib for lib in self.toolchain.find_libraries(search_dir)
+                     if not patterns or any(fnmatch.fnmatch(lib.name, p) for p in patterns)]
+        if not libraries:
+            msg = f'[{self.name.upper()}]: no compiled libraries found in \'{str(search_dir)}\''
+            return Result(Error.FILE_MISSING, msg)
+
+        with self.trace('libraries'):
+            self.target_build_dir.mkdir(parents=True, exist_ok=True)
+            for lib in libraries:
+                Builder.copyfile(lib, self.target_build_dir / lib.name)
+
+        return Result(Error.SUCCESS, [self.target_build_dir / lib.name for lib in libraries])
+
+    # Record the libraries, headers and config files of the staged outputs in `artifacts.json`
+    def record_artifacts(self) -> Artifacts:
+        root: Path = self.target_build_dir.parent
+        artifacts = Artifacts()
+
+        with self.trace('artifacts'):
+            for directory in (self.target_build_dir, self.target_include_dir):
+                for dirpath, _, filenames in os.walk(directory):
+                    for filename in sorted(filenames):
+                        path = Path(dirpath) / filename
+                        relative = path.relative_to(root).as_posix()
+
+                        if directory == self.target_include_dir:
+                            artifacts.headers.append(relative)
+                        elif filename.endswith('.pc'):
+                            artifacts.pkgconfig.append(relative)
+                        elif filename.endswith('.cmake'):
+                            artifacts.cmake.append(relative)
+                        elif self.toolchain.is_library(path):
+                            artifacts.libraries.append(relative)
+
+            artifacts.save(self.outputs.artifacts_path)
+
+        return artifacts
+
+    # Restore the outputs built for manifest `key` from the artifact store,
+    # returns False if there is nothing to restore
+    def restore(self, key: str) -> bool:
+        if self.store is None:
+            return False
+
+        return self.store.restore(self.outputs, key)
 
-        self.build_dir: Path = self.root_path / 'vendor' / self.name / 'build'
-        self.include_dir: Path = self.root_path / 'vendor' / self.name / 'include'
+    # Share the finished outputs with other checkouts through the artifact store,
+    # `replace` overwrites what is stored under `key` already
+    def publish(self, key: str, replace: bool = False):
+        if self.store is None:
+            return
 
-        self.target_build_dir: Path = self.root_path / 'deps' / self.name / 'build'
-        self.target_include_dir: Path = self.root_path / 'deps' / self.name / 'include'
+        self.store.publish(self.outputs, key, replace)
 
     def prepare(self) -> Result:
         return Result(Error.SUCCESS, None)
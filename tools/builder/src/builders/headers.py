@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from . import common as cm
+
+
+class HeaderBuilder(cm.Builder):
+    # ==============================================================================================
+    # Header-only libraries, their headers are staged and nothing is built
+    # ==============================================================================================
+    def __init__(self, root_path: Path, deps: dict, name: str, options: cm.BuildOptions = None):
+        super().__init__(root_path, deps, name, options)
+
+        self.tag: str = f'[{name.upper()}]'
+
+    def prepare(self) -> cm.Result:
+        # ==============================================================================================
+        # Create include directory and copy headers
+        # ==============================================================================================
+        if not self.target_include_dir.exists():
+            self.target_include_dir.mkdir(parents=True)
+
+        self.stage_headers()
+        if not self.target_include_dir.exists():
+            msg = f'{self.tag}: failed to transact copy to \'{str(self.target_include_dir)}\''
+            return cm.Result(cm.Error.FILE_COPY_FAILED, msg)
+
+        return super().prepare()
+
+    def build(self) -> cm.Result:
+        return super().build()
+
+    # Nothing is compiled, the CMake build options don't apply
+    def cmake_defines(self) -> dict[str, str]:
+        return {}
+
+    def clean(self) -> cm.Result:
+        return super().clean()
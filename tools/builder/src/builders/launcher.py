@@ -0,0 +1,146 @@
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import os
+import shutil
+import socket
+import subprocess as sp
+
+from utils.artifacts import cache_home
+
+
+# Compiler launchers, in order of preference when auto-detected
+LAUNCHERS = ['ccache', 'sccache']
+
+# ccache statistics counted as hits and misses, as written to its stats log
+CCACHE_HITS = ['direct_cache_hit', 'preprocessed_cache_hit']
+CCACHE_MISSES = ['cache_miss']
+
+
+# Resolve `--launcher` (auto, none, or a launcher name) to the launcher on PATH,
+# None if there is none to use
+def find_launcher(choice: str) -> str | None:
+    if choice == 'none':
+        return None
+
+    for tool in (LAUNCHERS if choice == 'auto' else [choice]):
+        path = shutil.which(tool)
+        if path is not None:
+            return path
+
+    return None
+
+
+# Cache directory of the launcher, kept apart from the user's own ccache/sccache cache
+def default_launcher_path(launcher: str) -> Path:
+    return cache_home() / f'template_cpp-{Path(launcher).stem}'
+
+
+@dataclass
+class LauncherStats(object):
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return f'{self.hits} hits, {self.misses} misses ({self.hit_rate:.0%})'
+
+
+class CompilerLauncher():
+    # ==============================================================================================
+    # Wraps every compiler invocation of one builder in ccache or sccache.
+    # Statistics are kept per builder, so concurrently running builders don't mix them up:
+    # ccache appends to a stats log of the builder, sccache runs a server per builder.
+    # ==============================================================================================
+    def __init__(self, path: str, cache_dir: Path, log_dir: Path, base_dir: Path):
+        self.path: str = path
+        self.tool: str = Path(path).stem
+        self.cache_dir: Path = cache_dir
+        self.base_dir: Path = base_dir
+
+        self.stats_log: Path = log_dir / 'ccache-stats.log'
+        self.port: int | None = None
+
+    def env(self) -> dict[str, str]:
+        if self.tool == 'sccache':
+            env = {'SCCACHE_DIR': str(self.cache_dir)}
+            if self.port is not None:
+                env['SCCACHE_SERVER_PORT'] = str(self.port)
+
+            return env
+
+        # ==========================================================================================
+        # Relative paths below the project root let other checkouts hit the same entries
+        # ==========================================================================================
+        return {
+            'CCACHE_DIR': str(self.cache_dir),
+            'CCACHE_BASEDIR': str(self.base_dir),
+            'CCACHE_STATSLOG': str(self.stats_log),
+        }
+
+    # Start counting from zero, before the builder compiles anything
+    def reset(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.tool == 'sccache':
+            self.port = free_port()
+        else:
+            self.stats_log.parent.mkdir(parents=True, exist_ok=True)
+            self.stats_log.unlink(missing_ok=True)
+
+    # Statistics since `reset`, None if the launcher couldn't report any.
+    # Stops the sccache server of this builder.
+    def finish(self) -> LauncherStats | None:
+        if self.tool == 'sccache':
+            return self.sccache_stats()
+
+        return self.ccache_stats()
+
+    def ccache_stats(self) -> LauncherStats | None:
+        try:
+            lines = self.stats_log.read_text().splitlines()
+        except OSError:
+            return None
+
+        stats = LauncherStats()
+        for line in lines:
+            if line in CCACHE_HITS:
+                stats.hits += 1
+            elif line in CCACHE_MISSES:
+                stats.misses += 1
+
+        return stats
+
+    def sccache_stats(self) -> LauncherStats | None:
+        if self.port is None:
+            return None
+
+        env = {**os.environ, **self.env()}
+        try:
+            out = sp.run([self.path, '--show-stats', '--stats-format=json'],
+                         capture_output=True, text=True, env=env).stdout
+            sp.run([self.path, '--stop-server'], capture_output=True, env=env)
+        except OSError:
+            return None
+        finally:
+            self.port = None
+
+        try:
+            data = json.loads(out)['stats']
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        return LauncherStats(
+            sum(data['cache_hits']['counts'].values()),
+            sum(data['cache_misses']['counts'].values()))
+
+
+# Port for a sccache server of our own, picked by the OS
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
@@ -0,0 +1,134 @@
+from hashlib import sha256
+from pathlib import Path
+from typing import Callable
+import os
+import re
+import shutil
+import subprocess as sp
+import threading
+import uuid
+
+from builders.toolchain import Toolchain
+
+
+# Tools CMake looked up, as written to the probe's `CMakeCache.txt`
+TOOL_ENTRY = re.compile(r'^(CMAKE_[A-Z_]+):FILEPATH=(.*)$')
+
+PROBE_PROJECT = 'cmake_minimum_required(VERSION 3.16)\nproject(toolchain_probe C CXX)\n'
+
+# Probes kept, one for every recently used toolchain
+PROBES_KEPT = 3
+
+# Builders running in parallel wait for the first one to probe
+probe_lock = threading.Lock()
+
+
+def cmake_string(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class ToolchainProbe():
+    # ==============================================================================================
+    # CMake identifies the compilers, detects their ABI and looks up the binutils in every new
+    # build tree. That's done once per toolchain instead, in a project of its own:
+    #
+    #   <cache>/<key>/initial-cache.cmake  tools the probe found, passed to `cmake -C`
+    #   <cache>/<key>/platform/<version>/  the probe's `CMakeFiles/<cmake version>`, copied into
+    #                                      every new build tree, so CMake finds them already known
+    #
+    # `key` covers the toolchain fingerprint (compiler binaries, CC/CXX/CFLAGS/...), the generator
+    # and the build type, so changing any of them probes again.
+    # ==============================================================================================
+    def __init__(self, cache_dir: Path, toolchain: Toolchain, fingerprint: str):
+        self.toolchain: Toolchain = toolchain
+
+        key = f'{fingerprint}:{toolchain.generator}:{toolchain.build_type}'
+        self.key: str = sha256(key.encode()).hexdigest()[:16]
+        self.directory: Path = cache_dir / self.key
+
+    @property
+    def initial_cache(self) -> Path:
+        return self.directory / 'initial-cache.cmake'
+
+    def ready(self) -> bool:
+        return self.initial_cache.exists()
+
+    # Probe the toolchain unless that happened before, running commands through `run`.
+    # Returns False if the probe failed, builds then detect the toolchain as usual.
+    def ensure(self, run: Callable[[list[str]], sp.CompletedProcess]) -> bool:
+        with probe_lock:
+            if self.ready():
+                # the most recently used probes are kept
+                os.utime(self.directory)
+                return True
+
+            tmp = self.directory.with_name(f'.{self.key}-{uuid.uuid4().hex[:8]}')
+            try:
+                if self.probe(tmp, run):
+                    os.rename(tmp, self.directory)
+                    self.prune()
+            except OSError:
+                # ==================================================================================
+                # Another process probed the same toolchain first, or the probe failed
+                # ==================================================================================
+                pass
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+            return self.ready()
+
+    def probe(self, tmp: Path, run: Callable[[list[str]], sp.CompletedProcess]) -> bool:
+        source_dir = tmp / 'source'
+        build_dir = tmp / 'build'
+        source_dir.mkdir(parents=True)
+        (source_dir / 'CMakeLists.txt').write_text(PROBE_PROJECT)
+
+        result = run(self.toolchain.configure_command(source_dir, build_dir))
+        if result.returncode != 0:
+            return False
+
+        platform = [path for path in (build_dir / 'CMakeFiles').iterdir()
+                    if (path / 'CMakeSystem.cmake').exists()]
+        if len(platform) != 1:
+            return False
+
+        # the compiler identification sources and binaries are of no use to later builds
+        shutil.copytree(platform[0], tmp / 'platform' / platform[0].name,
+                        ignore=shutil.ignore_patterns('CompilerId*'))
+
+        lines = ['# Written by tools/builder from a toolchain probe, do not edit']
+        for line in (build_dir / 'CMakeCache.txt').read_text().splitlines():
+            match = TOOL_ENTRY.match(line)
+            if match is not None and not match.group(2).endswith('-NOTFOUND'):
+                lines.append(f'set({match.group(1)} {cmake_string(match.group(2))} CACHE FILEPATH "")')
+
+        # ==========================================================================================
+        # Makes CMake load the copied platform files instead of detecting the toolchain again
+        # ==========================================================================================
+        lines.append('set(CMAKE_PLATFORM_INFO_INITIALIZED 1 CACHE INTERNAL "")')
+        (tmp / 'initial-cache.cmake').write_text('\n'.join(lines) + '\n')
+
+        shutil.rmtree(source_dir)
+        shutil.rmtree(build_dir)
+        return True
+
+    # Copy the probe's platform files into `build_dir`, unless it was configured before.
+    # Returns False if the build tree has to detect the toolchain itself.
+    def seed(self, build_dir: Path) -> bool:
+        if (build_dir / 'CMakeCache.txt').exists():
+            return True
+
+        try:
+            shutil.copytree(self.directory / 'platform', build_dir / 'CMakeFiles', dirs_exist_ok=True)
+        except OSError:
+            return False
+
+        return True
+
+    # Remove the probes of toolchains that weren't used recently
+    def prune(self):
+        probes = sorted((path for path in self.directory.parent.iterdir()
+                         if path.is_dir() and not path.name.startswith('.')),
+                        key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in probes[PROBES_KEPT:]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,134 @@
+from functools import cache
+from pathlib import Path
+import os
+import platform
+import re
+import shutil
+import subprocess as sp
+
+
+# Version of a tool on PATH as reported by `<tool> --version`, empty if it's missing
+@cache
+def tool_version(tool: str) -> tuple[int, ...]:
+    try:
+        out = sp.run([tool, '--version'], capture_output=True, text=True).stdout
+    except OSError:
+        return ()
+
+    match = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', out)
+    if match is None:
+        return ()
+
+    return tuple(int(group) for group in match.groups() if group is not None)
+
+
+class Toolchain():
+    # ==============================================================================================
+    # Describes how dependencies are configured and built on the host:
+    # the CMake generator, the build type, and platform library naming
+    # ==============================================================================================
+    build_type: str = 'Release'
+
+    # File name suffixes of libraries, per `platform.system()`
+    LIBRARY_SUFFIXES: dict[str, list[str]] = {
+        'windows': ['.lib', '.dll'],
+        'darwin': ['.a', '.dylib'],
+        'linux': ['.a', '.so'],
+    }
+
+    def __init__(self, generator: str = '', system: str = ''):
+        self.system: str = system or platform.system().lower()
+        self.generator: str = generator or Toolchain.default_generator(self.system)
+
+    # Ninja wherever it's available, the platform's native generator otherwise
+    @staticmethod
+    def default_generator(system: str) -> str:
+        if shutil.which('ninja') is not None:
+            return 'Ninja'
+
+        if system == 'windows':
+            return 'Visual Studio 16 2019'
+
+        return 'Unix Makefiles'
+
+    # Native tool that `cmake --build` drives for the generator
+    def build_tool(self) -> str | None:
+        return {'Ninja': 'ninja', 'Unix Makefiles': 'make'}.get(self.generator)
+
+    # How `tool` joins a GNU make jobserver, see `JobserverAuth.client`,
+    # or None if it can't
+    @staticmethod
+    def jobserver_style(tool: str | None) -> str | None:
+        version = tool_version(tool) if tool is not None else ()
+        if not version:
+            return None
+
+        if tool == 'ninja':
+            return 'fifo' if version >= (1, 13) else None
+
+        if tool == 'make':
+            if version >= (4, 4):
+                return 'fifo'
+
+            return 'auth' if version >= (4, 2) else 'fds'
+
+        return None
+
+    def is_multi_config(self) -> bool:
+        return self.generator.startswith(('Visual Studio', 'Xcode', 'Ninja Multi-Config'))
+
+    def configuration(self) -> dict:
+        return {'generator': self.generator, 'build_type': self.build_type, 'system': self.system}
+
+    # `initial_cache` is a script populating the cache before the project is read, see `cmake -C`
+    def configure_command(self, source_dir: Path, build_dir: Path, defines: dict[str, str] = None,
+                          initial_cache: Path = None) -> list[str]:
+        cmd = ['cmake', '-S', str(source_dir), '-B', str(build_dir), '-G', self.generator,
+               f'-DCMAKE_BUILD_TYPE={self.build_type}']
+        if initial_cache is not None:
+            cmd[1:1] = ['-C', str(initial_cache)]
+        if self.generator.startswith('Visual Studio'):
+            cmd += ['-A', 'x64']
+
+        for key, value in (defines or {}).items():
+            cmd.append(f'-D{key}={value}')
+
+        return cmd
+
+    # With `jobserver` the build tool takes its parallelism from the jobserver,
+    # otherwise it's limited to `cpus` jobs
+    def build_command(self, build_dir: Path, cpus: int, targets: list[str] = None, jobserver: bool = False) -> list[str]:
+        cmd = ['cmake', '--build', str(build_dir), '--config', self.build_type]
+        if not jobserver:
+            cmd += ['--parallel', str(cpus)]
+
+        if targets:
+            cmd += ['--target', *targets]
+
+        return cmd
+
+    # Install into `prefix` instead of the prefix the project was configured with
+    def install_command(self, build_dir: Path, prefix: Path) -> list[str]:
+        return ['cmake', '--install', str(build_dir), '--prefix', str(prefix), '--config', self.build_type]
+
+    def is_library(self, path: Path) -> bool:
+        suffixes = Toolchain.LIBRARY_SUFFIXES.get(self.system, ['.a', '.so'])
+
+        # versioned shared objects, e.g. `libsfml-system.so.2.6`
+        name = path.name
+        if '.so.' in name:
+            name = name[:name.index('.so.') + 3]
+
+        return any(name.endswith(suffix) for suffix in suffixes)
+
+    # Every library below `directory`, skipping CMake's own scratch directories
+    def find_libraries(self, directory: Path) -> list[Path]:
+        libraries: list[Path] = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if d != 'CMakeFiles']
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if self.is_library(path):
+                    libraries.append(path)
+
+        return sorted(libraries)
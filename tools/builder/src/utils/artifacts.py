@@ -0,0 +1,188 @@
+from pathlib import Path
+import os
+import shutil
+import uuid
+
+from utils.files import clone_tree, tree_size
+from utils.types import Dependency
+
+
+# Per-user cache directory, shared between all checkouts on this host
+def cache_home() -> Path:
+    path = os.environ.get('XDG_CACHE_HOME', '')
+    if path == '':
+        path = str(Path.home() / '.cache')
+
+    return Path(path)
+
+
+# Default location of the store shared between all checkouts on this host
+def default_store_path() -> Path:
+    if 'TEMPLATE_CPP_BUILDER_CACHE' in os.environ:
+        return Path(os.environ['TEMPLATE_CPP_BUILDER_CACHE'])
+
+    return cache_home() / 'template_cpp-builder'
+
+
+class ArtifactStore():
+    # ==============================================================================================
+    # Finished `deps/<name>` outputs, stored outside of the repository as
+    #
+    #   <root>/<name>/<key>/{build,include,manifest.json,artifacts.json,size}
+    #
+    # where `key` is the build manifest key, covering the dependency sources,
+    # toolchain and configuration. Entries are written to `<root>/tmp` and
+    # renamed into place, so readers never see a partially published entry.
+    # `size` records the size of the entry when it was published, for eviction.
+    # ==============================================================================================
+    def __init__(self, root: Path, max_size: int):
+        self.root: Path = root
+        self.max_size: int = max_size
+
+    def entry(self, name: str, key: str) -> Path:
+        return self.root / name / key
+
+    def tmp(self) -> Path:
+        path = self.root / 'tmp' / uuid.uuid4().hex
+        path.mkdir(parents=True)
+
+        return path
+
+    def contains(self, name: str, key: str) -> bool:
+        return (self.entry(name, key) / 'manifest.json').exists()
+
+    # Copy a stored entry into the dependency outputs, returns False on a miss
+    def restore(self, dep: Dependency, key: str) -> bool:
+        entry = self.entry(dep.name, key)
+        if not self.contains(dep.name, key):
+            return False
+
+        try:
+            for src, dst in self.outputs(entry, dep):
+                if dst.is_symlink():
+                    dst.unlink()
+                elif dst.exists():
+                    shutil.rmtree(dst)
+
+                if src.exists():
+                    clone_tree(src, dst)
+
+            if (entry / 'artifacts.json').exists():
+                shutil.copy2(entry / 'artifacts.json', dep.artifacts_path)
+
+            # the entry's mtime records when it was last used, for eviction
+            os.utime(entry)
+        except OSError:
+            # ======================================================================================
+            # The entry was evicted by another builder while being restored
+            # ======================================================================================
+            for _, dst in self.outputs(entry, dep):
+                shutil.rmtree(dst, ignore_errors=True)
+
+            return False
+
+        return True
+
+    # Store the dependency outputs under `key`, unless an entry already exists.
+    # With `replace` an existing entry is replaced, e.g. by a forced rebuild.
+    def publish(self, dep: Dependency, key: str, replace: bool = False):
+        entry = self.entry(dep.name, key)
+        if self.contains(dep.name, key) and not replace:
+            os.utime(entry)
+            return
+
+        tmp = self.tmp()
+        try:
+            # ======================================================================================
+            # Headers staged as links into the sources are copied, editing the sources
+            # mustn't change what's stored
+            # ======================================================================================
+            for dst, src in self.outputs(tmp, dep):
+                if src.exists():
+                    clone_tree(src, dst, link_shared=False)
+
+            shutil.copy2(dep.manifest_path, tmp / 'manifest.json')
+            if dep.artifacts_path.exists():
+                shutil.copy2(dep.artifacts_path, tmp / 'artifacts.json')
+            (tmp / 'size').write_text(str(tree_size(tmp)))
+
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            if replace:
+                self.remove(entry)
+
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # ==================================================================================
+                # Someone else published the same entry first
+                # ==================================================================================
+                pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict()
+
+    # Remove the least recently used entries until the store fits in `max_size` bytes.
+    # Other builders may evict at the same time, entries vanishing meanwhile are skipped.
+    def evict(self):
+        entries: list[tuple[float, Path, int]] = []
+        for dep_dir in self.root.iterdir():
+            if dep_dir.name == 'tmp' or not dep_dir.is_dir():
+                continue
+
+            try:
+                children = list(dep_dir.iterdir())
+            except OSError:
+                continue
+
+            for entry in children:
+                try:
+                    entries.append((entry.stat().st_mtime, entry, self.size(entry)))
+                except OSError:
+                    continue
+
+        entries.sort()
+        total: int = sum(size for _, _, size in entries)
+
+        for _, entry, size in entries:
+            if total <= self.max_size:
+                break
+
+            if self.remove(entry):
+                total -= size
+
+    # Size of an entry as recorded when it was published,
+    # measured once for entries published before sizes were recorded
+    def size(self, entry: Path) -> int:
+        try:
+            return int((entry / 'size').read_text())
+        except (FileNotFoundError, ValueError):
+            pass
+
+        size = tree_size(entry)
+        tmp = self.tmp() / 'size'
+        tmp.write_text(str(size))
+        try:
+            os.replace(tmp, entry / 'size')
+        finally:
+            shutil.rmtree(tmp.parent, ignore_errors=True)
+
+        return size
+
+    # Remove an entry, renaming it first so it disappears atomically for readers
+    def remove(self, entry: Path) -> bool:
+        trash = self.root / 'tmp' / uuid.uuid4().hex
+        try:
+            os.rename(entry, trash)
+        except OSError:
+            return False
+
+        shutil.rmtree(trash, ignore_errors=True)
+        return True
+
+    @staticmethod
+    def outputs(entry: Path, dep: Dependency) -> list[tuple[Path, Path]]:
+        return [
+            (entry / 'build', dep.target_build_dir),
+            (entry / 'include', dep.target_include_dir),
+        ]
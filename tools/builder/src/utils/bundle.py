@@ -0,0 +1,195 @@
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+import lzma
+import os
+import shutil
+import subprocess as sp
+import tarfile
+import uuid
+
+from utils.fingerprint import hash_file
+from utils.manifest import Manifest
+from utils.types import Dependency
+
+
+# Compressed bundle formats, in order of preference
+BUNDLE_SUFFIXES = ['.tar.zst', '.tar.xz']
+
+
+# Directory holding bundles, given as a path or a `file://` url of a mirror
+def bundle_dir(location: str) -> Path:
+    url = urlparse(location)
+    if url.scheme == 'file':
+        return Path(unquote(url.path))
+
+    # a single letter is the drive of a windows path
+    if len(url.scheme) <= 1:
+        return Path(location)
+
+    raise RuntimeError(f'unsupported bundle location \'{location}\', use a path or file:// url')
+
+
+def zstd_available() -> bool:
+    return shutil.which('zstd') is not None
+
+
+# Bundles are addressed by the dependency name and its build manifest key,
+# `<name>-<key>.tar.zst`, next to a `.sha256` file holding the digest of the archive
+def bundle_name(name: str, key: str, suffix: str) -> str:
+    return f'{name}-{key}{suffix}'
+
+
+def digest_path(path: Path) -> Path:
+    return path.with_name(path.name + '.sha256')
+
+
+# Find a bundle built for `key`, None if the directory has none
+def find_bundle(directory: Path, name: str, key: str) -> Path | None:
+    for suffix in BUNDLE_SUFFIXES:
+        path = directory / bundle_name(name, key, suffix)
+        if path.exists() and digest_path(path).exists():
+            return path
+
+    return None
+
+
+# Serialize the outputs and build manifest of `dep` into `directory`, returns the bundle path.
+# An existing bundle for the same key is kept as it is.
+def pack(dep: Dependency, key: str, directory: Path) -> Path:
+    existing = find_bundle(directory, dep.name, key)
+    if existing is not None:
+        return existing
+
+    suffix = '.tar.zst' if zstd_available() else '.tar.xz'
+    path = directory / bundle_name(dep.name, key, suffix)
+    tmp = directory / f'.{path.name}.{uuid.uuid4().hex}'
+
+    directory.mkdir(parents=True, exist_ok=True)
+    try:
+        # ==========================================================================================
+        # Stream the tar straight into the compressor, nothing is held in memory
+        # ==========================================================================================
+        if suffix == '.tar.zst':
+            proc = sp.Popen(['zstd', '-q', '-T0', '-f', '-o', str(tmp)], stdin=sp.PIPE)
+            try:
+                with tarfile.open(fileobj=proc.stdin, mode='w|', dereference=True) as tar:
+                    add_outputs(tar, dep)
+            finally:
+                proc.stdin.close()
+                returncode = proc.wait()
+
+            if returncode != 0:
+                raise RuntimeError(f'[{dep.name.upper()}]: zstd failed to compress \'{str(path)}\'')
+        else:
+            with lzma.open(tmp, 'wb') as xz, tarfile.open(fileobj=xz, mode='w|', dereference=True) as tar:
+                add_outputs(tar, dep)
+
+        # ==========================================================================================
+        # The digest is written last, a bundle without one is never picked up
+        # ==========================================================================================
+        os.replace(tmp, path)
+        digest = digest_path(path)
+        digest.with_suffix('.tmp').write_text(f'{hash_file(path)}  {path.name}\n')
+        os.replace(digest.with_suffix('.tmp'), digest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    return path
+
+
+# Staged headers may be symlinks into the sources, bundles always hold the files themselves
+def add_outputs(tar: tarfile.TarFile, dep: Dependency):
+    for arcname, src in [('build', dep.target_build_dir), ('include', dep.target_include_dir)]:
+        if src.exists():
+            tar.add(src, arcname)
+
+    tar.add(dep.manifest_path, 'manifest.json')
+    if dep.artifacts_path.exists():
+        tar.add(dep.artifacts_path, 'artifacts.json')
+
+
+# Verify the bundle against its digest and unpack it into the outputs of `dep`.
+# Returns False, leaving the outputs untouched, if the bundle is corrupt or wasn't built for `key`.
+def unpack(path: Path, dep: Dependency, key: str) -> bool:
+    # ==============================================================================================
+    # Check the archive before anything is extracted, reading it in chunks
+    # ==============================================================================================
+    try:
+        expected = digest_path(path).read_text().split()[0]
+    except (OSError, IndexError):
+        return False
+
+    if hash_file(path) != expected:
+        return False
+
+    tmp = dep.target_build_dir.parent.parent / f'.{dep.name}.unpack-{uuid.uuid4().hex}'
+    tmp.mkdir(parents=True)
+    dep.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # ==========================================================================================
+        # Extract through a streaming decompressor, members are never seeked back to
+        # ==========================================================================================
+        if path.name.endswith('.tar.zst'):
+            if not zstd_available():
+                raise RuntimeError(f'[{dep.name.upper()}]: zstd is needed to unpack \'{str(path)}\'')
+
+            proc = sp.Popen(['zstd', '-q', '-d', '-c', str(path)], stdout=sp.PIPE)
+            try:
+                with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+                    extract(tar, tmp)
+            finally:
+                proc.stdout.close()
+                returncode = proc.wait()
+
+            if returncode != 0:
+                return False
+        else:
+            with lzma.open(path, 'rb') as xz, tarfile.open(fileobj=xz, mode='r|') as tar:
+                extract(tar, tmp)
+
+        manifest = Manifest.load(tmp / 'manifest.json')
+        if manifest is None or manifest.key() != key:
+            return False
+
+        # ==========================================================================================
+        # Swap the extracted outputs in, the manifest goes last so an interrupted
+        # unpack is seen as out of date
+        # ==========================================================================================
+        dep.manifest_path.unlink(missing_ok=True)
+        for name, dst in [('build', dep.target_build_dir), ('include', dep.target_include_dir)]:
+            if dst.is_symlink():
+                dst.unlink()
+            elif dst.exists():
+                shutil.rmtree(dst)
+
+            if (tmp / name).exists():
+                os.replace(tmp / name, dst)
+
+        if (tmp / 'artifacts.json').exists():
+            os.replace(tmp / 'artifacts.json', dep.artifacts_path)
+        os.replace(tmp / 'manifest.json', dep.manifest_path)
+    except (OSError, tarfile.TarError, EOFError, lzma.LZMAError):
+        return False
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return True
+
+
+# Extract without letting members escape `dst` through absolute paths, `..` or links
+def extract(tar: tarfile.TarFile, dst: Path):
+    if hasattr(tarfile, 'data_filter'):
+        tar.extractall(dst, filter='data')
+        return
+
+    root = dst.resolve()
+    for member in tar:
+        target = (root / member.name).resolve()
+        if root not in target.parents and target != root:
+            raise tarfile.TarError(f'member \'{member.name}\' escapes the bundle')
+        if member.issym() or member.islnk():
+            link = (target.parent / member.linkname).resolve()
+            if root not in link.parents:
+                raise tarfile.TarError(f'link \'{member.name}\' escapes the bundle')
+
+        tar.extract(member, dst)
@@ -0,0 +1,94 @@
+from pathlib import Path
+import errno
+import os
+import shutil
+import sys
+
+if sys.platform == 'linux':
+    import fcntl
+else:
+    fcntl = None
+
+
+# `FICLONE` ioctl from <linux/fs.h>
+FICLONE = 0x40049409
+
+
+# Make `dst` a copy-on-write clone of `src`, returns False if the filesystem can't do it
+def reflink(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+
+    try:
+        with open(src, 'rb') as s, open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+            raise
+
+        Path(dst).unlink(missing_ok=True)
+        return False
+
+    shutil.copystat(src, dst)
+    return True
+
+
+def hardlink(src: Path, dst: Path) -> bool:
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+
+        return False
+
+    return True
+
+
+# Whether `path` is a symlink or has other hard links, e.g. a header staged as a link into the sources
+def is_shared(path: Path) -> bool:
+    st = os.lstat(path)
+    return os.path.islink(path) or st.st_nlink > 1
+
+
+# Place `src` at `dst` as cheaply as the filesystem allows:
+# a reflink, then a hardlink (unless `link` is False), then a regular copy
+def clone_file(src: Path, dst: Path, link: bool = True):
+    Path(dst).unlink(missing_ok=True)
+
+    if reflink(src, dst) or (link and hardlink(src, dst)):
+        return
+
+    shutil.copy2(src, dst)
+
+
+# With `link_shared` False, files that are shared with another path (see `is_shared`), or all of
+# them if `src` itself is a symlink, are reflinked or copied, so editing that other path can't
+# change the clone
+def clone_tree(src: Path, dst: Path, link_shared: bool = True):
+    linked = os.path.islink(src)
+
+    for dirpath, _, filenames in os.walk(src):
+        target = Path(dst) / Path(dirpath).relative_to(src)
+        target.mkdir(parents=True, exist_ok=True)
+
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            clone_file(path, target / filename, link_shared or not (linked or is_shared(path)))
+
+
+# Apparent size of a tree, counting hardlinked files once
+def tree_size(path: Path) -> int:
+    seen: set = set()
+    size: int = 0
+
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            st = os.lstat(os.path.join(dirpath, filename))
+            if (st.st_dev, st.st_ino) in seen:
+                continue
+
+            seen.add((st.st_dev, st.st_ino))
+            size += st.st_size
+
+    return size
@@ -0,0 +1,210 @@
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from pathlib import Path
+import hashlib
+import json
+import os
+import subprocess as sp
+import time
+import uuid
+
+
+# Directories never considered part of a source tree
+IGNORED_DIRS = ['.git', '.build']
+
+# Files modified this close to the time they were hashed may change again without their
+# size or mtime changing, their hashes are not cached (the "racy git" problem)
+RACY_NS = 2 * 1000 * 1000 * 1000
+
+STAT_CACHE_VERSION = 1
+
+
+def hash_file(path: Path) -> str:
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+        # ==========================================================================================
+        # Python < 3.11
+        # ==========================================================================================
+        digest = sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+        return digest.hexdigest()
+
+
+def git(cwd: Path, *args: str) -> str | None:
+    try:
+        result = sp.run(['git', '-C', str(cwd), *args],
+                        capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    return result.stdout
+
+
+# Files below `source_dir` in the order they are hashed in: the files of a directory
+# sorted by name, followed by its subdirectories sorted by name. Symlinked directories
+# aren't followed. Returns paths relative to `source_dir`, with their stat results.
+def walk(source_dir: Path) -> list[tuple[str, os.stat_result]]:
+    files: list[tuple[str, os.stat_result]] = []
+
+    def visit(path: str, relative: str):
+        try:
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+        except OSError:
+            return
+
+        dirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            if is_dir:
+                if entry.name not in IGNORED_DIRS and not entry.is_symlink():
+                    dirs.append(entry)
+                continue
+
+            try:
+                st = entry.stat()
+            except OSError:
+                # broken symlink
+                continue
+
+            files.append((os.path.join(relative, entry.name) if relative else entry.name, st))
+
+        for entry in dirs:
+            visit(entry.path, os.path.join(relative, entry.name) if relative else entry.name)
+
+    visit(str(source_dir), '')
+    return files
+
+
+class StatCache():
+    # ==============================================================================================
+    # Hashes of the files of one source tree, keyed by path relative to the tree and
+    # valid as long as size, mtime and inode of the file are unchanged:
+    #
+    #   {"version": 1, "files": {"<path>": [size, mtime_ns, inode, "<sha256>"]}}
+    #
+    # Only files whose stat changed since the cache was written are hashed again.
+    # ==============================================================================================
+    def __init__(self, path: Path | None):
+        self.path: Path | None = path
+        self.entries: dict[str, list] = {}
+
+        if path is not None:
+            try:
+                data = json.loads(path.read_text())
+                if data.get('version') == STAT_CACHE_VERSION:
+                    self.entries = data['files']
+            except (OSError, ValueError, KeyError, AttributeError):
+                pass
+
+    def lookup(self, relative: str, st: os.stat_result) -> str | None:
+        entry = self.entries.get(relative)
+        if entry is None or entry[:3] != [st.st_size, st.st_mtime_ns, st.st_ino]:
+            return None
+
+        return entry[3]
+
+    # Hash of every file in `files`, reading only those whose stat changed.
+    # Afterwards the cache holds exactly these files.
+    def hash_files(self, source_dir: Path, files: list[tuple[str, os.stat_result]]) -> dict[str, str]:
+        hashes: dict[str, str] = {}
+        stale: list[str] = []
+        for relative, st in files:
+            digest = self.lookup(relative, st)
+            if digest is None:
+                stale.append(relative)
+            else:
+                hashes[relative] = digest
+
+        if len(stale) > 1:
+            with ThreadPoolExecutor(min(32, (os.cpu_count() or 1) + 4)) as pool:
+                hashes.update(zip(stale, pool.map(lambda relative: hash_file(source_dir / relative), stale)))
+        elif stale:
+            hashes[stale[0]] = hash_file(source_dir / stale[0])
+
+        now = time.time_ns()
+        self.entries = {
+            relative: [st.st_size, st.st_mtime_ns, st.st_ino, hashes[relative]]
+            for relative, st in files if now - st.st_mtime_ns > RACY_NS
+        }
+
+        return hashes
+
+    def save(self):
+        if self.path is None:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            # several builders may fingerprint the same tree at once
+            tmp = self.path.with_name(f'.{self.path.name}.{uuid.uuid4().hex}')
+            tmp.write_text(json.dumps({'version': STAT_CACHE_VERSION, 'files': self.entries}))
+            os.replace(tmp, self.path)
+        except OSError:
+            # only an optimization
+            pass
+
+
+# The commit checked out in `source_dir`, None unless it's the top of its own checkout
+# (e.g. a submodule listed in `.gitmodules`), as we would be looking at the parent repository
+def checkout_head(source_dir: Path) -> str | None:
+    out = git(source_dir, 'rev-parse', '--show-toplevel', 'HEAD')
+    lines = out.splitlines() if out is not None else []
+    if len(lines) == 2 and Path(lines[0]).resolve() == source_dir.resolve():
+        return lines[1]
+
+    return None
+
+
+# ==================================================================================================
+# Hash of a source tree: the checked out submodule commit plus the contents of every
+# modified or untracked file, or of every file if the tree is not a git checkout.
+# A clean checkout costs a `git rev-parse` and a `git status`, anything else is read only
+# if its stat changed since the hashes were cached in `cache_path`.
+# ==================================================================================================
+def fingerprint_tree(source_dir: Path, cache_path: Path | None = None) -> str:
+    digest = sha256()
+    if not source_dir.exists():
+        return digest.hexdigest()
+
+    cache = StatCache(cache_path)
+
+    head = checkout_head(source_dir)
+    if head is not None:
+        digest.update(head.encode())
+
+        status = git(source_dir, 'status', '--porcelain', '-z',
+                     '--untracked-files=all', '--ignore-submodules=dirty')
+        entries = sorted(filter(None, (status or '').split('\0')))
+
+        files: list[tuple[str, os.stat_result]] = []
+        for entry in entries:
+            path = source_dir / entry[3:]
+            if path.is_file():
+                files.append((entry[3:], path.stat()))
+
+        hashes = cache.hash_files(source_dir, files)
+        for entry in entries:
+            digest.update(entry.encode())
+            if entry[3:] in hashes:
+                digest.update(hashes[entry[3:]].encode())
+    else:
+        files = walk(source_dir)
+        hashes = cache.hash_files(source_dir, files)
+        for relative, _ in files:
+            digest.update(relative.encode())
+            digest.update(hashes[relative].encode())
+
+    cache.save()
+    return digest.hexdigest()
@@ -0,0 +1,87 @@
+from pathlib import Path
+import json
+import os
+import statistics
+import uuid
+
+from utils.trace import Span
+
+
+# Runs remembered per dependency, estimates are the median over them
+HISTORY_RUNS = 5
+
+# Phases of a run that actually built the dependency, runs that restored or
+# unpacked the outputs, or only found them up to date, have none of them
+BUILD_PHASES = ['prepare', 'build', 'remote']
+
+
+def history_path(root_path: Path) -> Path:
+    return root_path / 'deps' / '.history.json'
+
+
+class History():
+    # ==============================================================================================
+    # How long the latest runs of every dependency took, when they actually produced outputs:
+    #
+    #   {"<name>": [{"wall": seconds, "phases": {"<phase>": seconds}, "rss": bytes}, ...]}
+    #
+    # Only runs that built the dependency are recorded, estimates are
+    # what it takes to (re)build it.
+    # ==============================================================================================
+    def __init__(self, path: Path):
+        self.path: Path = path
+        self.runs: dict[str, list[dict]] = {}
+
+        try:
+            data = json.loads(path.read_text())
+            if isinstance(data, dict):
+                self.runs = data
+        except (OSError, ValueError):
+            pass
+
+    # Estimated wall time of building `name`, None if it was never built
+    def estimate(self, name: str) -> float | None:
+        runs = self.runs.get(name)
+        if not runs:
+            return None
+
+        return statistics.median(run['wall'] for run in runs)
+
+    # Peak memory use of the build tools over the remembered runs, None if it was never measured
+    def memory_estimate(self, name: str) -> int | None:
+        peaks = [run['rss'] for run in self.runs.get(name, []) if run.get('rss')]
+        if not peaks:
+            return None
+
+        return max(peaks)
+
+    # Record the phase and memory spans of one run of the dependency
+    def record(self, name: str, spans: list[Span]):
+        phases = [span for span in spans if span.category == 'phase' and span.dep == name]
+        if not any(span.name in BUILD_PHASES for span in phases):
+            return
+
+        durations: dict[str, float] = {}
+        for span in phases:
+            durations[span.name] = durations.get(span.name, 0.0) + span.duration
+
+        wall = max(span.end for span in phases) - min(span.start for span in phases)
+        run = {'wall': round(wall, 3), 'phases': {k: round(v, 3) for k, v in durations.items()}}
+
+        peaks = [span.args['peak'] for span in spans if span.category == 'memory' and span.dep == name]
+        if peaks:
+            run['rss'] = max(peaks)
+
+        runs = self.runs.setdefault(name, [])
+        runs.append(run)
+        del runs[:-HISTORY_RUNS]
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f'.{self.path.name}.{uuid.uuid4().hex}')
+            tmp.write_text(json.dumps(self.runs, indent=4, sort_keys=True))
+            os.replace(tmp, self.path)
+        except OSError:
+            # only used for scheduling
+            pass
@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+import os
+import shutil
+import tempfile
+
+
+@dataclass
+class JobserverAuth(object):
+    # ==============================================================================================
+    # What a child needs to join the jobserver: the fifo path (GNU make >= 4.4, ninja >= 1.13)
+    # or the read and write ends of it, inherited as file descriptors (older GNU make)
+    # ==============================================================================================
+    jobs: int
+    path: str
+    read_fd: int
+    write_fd: int
+
+    # Environment and file descriptors for a child speaking the given jobserver `style`,
+    # one of 'fifo', 'auth' (`--jobserver-auth=R,W`) or 'fds' (`--jobserver-fds=R,W`)
+    def client(self, style: str) -> tuple[dict[str, str], tuple[int, ...]]:
+        if style == 'fifo':
+            return {'MAKEFLAGS': f' -j{self.jobs} --jobserver-auth=fifo:{self.path}'}, ()
+
+        option = '--jobserver-auth' if style == 'auth' else '--jobserver-fds'
+        flags = f' -j{self.jobs} {option}={self.read_fd},{self.write_fd}'
+
+        return {'MAKEFLAGS': flags}, (self.read_fd, self.write_fd)
+
+
+class Jobserver():
+    # ==============================================================================================
+    # GNU make style jobserver: a fifo preloaded with one token per job slot.
+    # Every child build tool that takes part holds one implicit slot and reads a token
+    # from the fifo for each additional job, so all of them share one global budget.
+    # ==============================================================================================
+    def __init__(self, jobs: int, implicit: int):
+        self.jobs: int = max(1, jobs)
+        self.dir: str = tempfile.mkdtemp(prefix='builder-jobserver-')
+        self.path: str = os.path.join(self.dir, 'fifo')
+
+        os.mkfifo(self.path, 0o600)
+
+        # ==========================================================================================
+        # Opening both ends keeps the fifo (and the tokens in it) alive for as long as we run
+        # ==========================================================================================
+        self.read_fd: int = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        self.write_fd: int = os.open(self.path, os.O_WRONLY)
+        os.set_blocking(self.read_fd, True)
+
+        # every concurrently running child already holds one implicit slot
+        os.write(self.write_fd, b'+' * max(0, self.jobs - implicit))
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, 'mkfifo')
+
+    def auth(self) -> JobserverAuth:
+        return JobserverAuth(self.jobs, self.path, self.read_fd, self.write_fd)
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,113 @@
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+import json
+import os
+import platform
+import shutil
+
+from utils.types import Dependency
+
+
+# Tools whose identity affects what a dependency build produces
+TOOLCHAIN_TOOLS = ['cmake', 'ninja', 'make', 'msbuild', 'genie',
+                   'cc', 'c++', 'gcc', 'g++', 'clang', 'clang++', 'cl']
+TOOLCHAIN_ENV = ['CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'LDFLAGS']
+
+
+# Fingerprint of the tools found on PATH, without running any of them
+def toolchain_fingerprint() -> str:
+    digest = sha256()
+    digest.update(f'{platform.system()}-{platform.machine()}'.encode())
+
+    tools = TOOLCHAIN_TOOLS + [os.environ.get('CC', ''), os.environ.get('CXX', '')]
+    for tool in filter(None, tools):
+        path = shutil.which(tool)
+        if path is None:
+            continue
+
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        digest.update(f'{tool}={real}:{st.st_size}:{st.st_mtime_ns}'.encode())
+
+    for var in TOOLCHAIN_ENV:
+        digest.update(f'{var}={os.environ.get(var, "")}'.encode())
+
+    return digest.hexdigest()
+
+
+@dataclass
+class Manifest(object):
+    name: str
+    sources: str
+    toolchain: str
+    configuration: dict[str, Any] = field(default_factory=dict)
+
+    # Source hashes of the dependencies this one was built against
+    requires: dict[str, str] = field(default_factory=dict)
+
+    def key(self) -> str:
+        data = json.dumps(asdict(self), sort_keys=True)
+        return sha256(data.encode()).hexdigest()
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(
+            {**asdict(self), 'key': self.key()}, indent=4, sort_keys=True))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: Path):
+        try:
+            data = json.loads(path.read_text())
+            data.pop('key', None)
+            return Manifest(**data)
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def create(dep: Dependency, deps: dict, configuration: dict[str, Any], toolchain: str = None):
+        requires: dict[str, str] = {}
+
+        pending: list[str] = list(dep.requires)
+        while pending:
+            name = pending.pop(0)
+            if name in requires:
+                continue
+
+            requires[name] = deps[name].fingerprint()
+            pending.extend(deps[name].requires)
+
+        return Manifest(
+            dep.name,
+            dep.fingerprint(),
+            toolchain if toolchain is not None else toolchain_fingerprint(),
+            configuration,
+            requires
+        )
+
+
+@dataclass
+class Artifacts(object):
+    # Paths relative to `deps/<name>`
+    libraries: list[str] = field(default_factory=list)
+    headers: list[str] = field(default_factory=list)
+    pkgconfig: list[str] = field(default_factory=list)
+    cmake: list[str] = field(default_factory=list)
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(asdict(self), indent=4))
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: Path):
+        try:
+            return Artifacts(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
@@ -0,0 +1,133 @@
+from pathlib import Path
+from typing import Callable
+import os
+import threading
+
+
+PROC = Path('/proc')
+
+# Memory a link step is expected to need at most, for sizing the Ninja link pool
+LINK_MEMORY = 2 << 30
+
+
+# Memory available to new processes without swapping, None where `/proc` doesn't tell
+def available_memory() -> int | None:
+    try:
+        with open(PROC / 'meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+# Parent pid and resident set size in bytes of every process, from `/proc/<pid>/stat`
+def processes() -> dict[int, tuple[int, int]]:
+    page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    table: dict[int, tuple[int, int]] = {}
+    try:
+        entries = os.listdir(PROC)
+    except OSError:
+        return table
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open(PROC / entry / 'stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            # exited in the meantime
+            continue
+
+        # ==========================================================================================
+        # The command name may contain spaces and parentheses, the fields follow the last ')'
+        # ==========================================================================================
+        fields = stat[stat.rfind(b')') + 2:].split()
+        try:
+            table[int(entry)] = (int(fields[1]), int(fields[21]) * page)
+        except (IndexError, ValueError):
+            continue
+
+    return table
+
+
+# Combined resident set size of `pid` and all of its descendants
+def tree_rss(pid: int) -> int:
+    table = processes()
+
+    children: dict[int, list[int]] = {}
+    for child, (parent, _) in table.items():
+        children.setdefault(parent, []).append(child)
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        if current in table:
+            total += table[current][1]
+        pending.extend(children.get(current, []))
+
+    return total
+
+
+# Link jobs that fit into the available memory, between 1 and `cpus`
+def link_jobs(cpus: int) -> int:
+    available = available_memory()
+    if available is None:
+        return cpus
+
+    return max(1, min(cpus, available // LINK_MEMORY))
+
+
+class MemoryMonitor():
+    # ==============================================================================================
+    # Keeps concurrently running builders within the available memory. Builders report the
+    # resident set size of their build tools as it's sampled, and a new builder only starts if
+    # its estimated peak fits next to what the running ones are still expected to grow by,
+    # plus `headroom`. One builder is always allowed to run, whatever it needs.
+    # ==============================================================================================
+    def __init__(self, estimates: dict[str, int], headroom: int, log: Callable[[str], None] = None):
+        self.estimates: dict[str, int] = estimates
+        self.headroom: int = headroom
+        self.log: Callable[[str], None] | None = log
+
+        self.current: dict[str, int] = {}
+        self.deferred: set[str] = set()
+        self.lock = threading.Lock()
+
+    def update(self, name: str, rss: int):
+        with self.lock:
+            self.current[name] = rss
+
+    def finish(self, name: str):
+        with self.lock:
+            self.current.pop(name, None)
+
+    def admit(self, name: str, running: list[str]) -> bool:
+        if not running:
+            return True
+
+        available = available_memory()
+        if available is None:
+            return True
+
+        with self.lock:
+            growth = sum(max(0, self.estimates.get(other, 0) - self.current.get(other, 0))
+                         for other in running)
+
+        needed = self.estimates.get(name, 0) + growth + self.headroom
+        if needed <= available:
+            self.deferred.discard(name)
+            return True
+
+        if name not in self.deferred and self.log is not None:
+            self.deferred.add(name)
+            self.log(f'[{name.upper()}]: waiting for memory, needs {needed >> 20} MiB '
+                     f'with {available >> 20} MiB available')
+
+        return False
@@ -0,0 +1,204 @@
+from pathlib import Path
+import os
+import sys
+
+from utils.manifest import Artifacts
+from utils.types import Dependency, DependencySpec
+
+
+# Name of the host platform, as used by the `system_libs` keys in `deps.toml`
+def host_platform() -> str:
+    if sys.platform == 'win32':
+        return 'windows'
+
+    return sys.platform
+
+
+# Directory holding the generated `<name>.pc` files
+def pkgconfig_dir(root_path: Path) -> Path:
+    return root_path / 'deps' / 'pkgconfig'
+
+
+# Meson machine file describing every built dependency
+def native_file_path(root_path: Path) -> Path:
+    return root_path / 'deps' / 'native.ini'
+
+
+class Usage():
+    # ==============================================================================================
+    # Compile and link flags of a built dependency. Paths point at the stable `deps/<name>`
+    # outputs, which stay valid when a new version is published, and libraries are named
+    # by their full path so exactly the libraries that were just built are linked.
+    # ==============================================================================================
+    def __init__(self, dep: Dependency, artifacts: Artifacts, specs: dict[str, DependencySpec]):
+        self.dep: Dependency = dep
+        self.prefix: Path = dep.target_build_dir.parent
+
+        self.include_dirs: list[Path] = [dep.target_include_dir]
+        self.libraries: list[Path] = [self.prefix / path for path in artifacts.libraries
+                                      if is_linkable(path)]
+        self.system_libs: list[str] = list(dep.spec.system_libs.get(host_platform(), []))
+        self.requires: list[str] = []
+
+        # ==========================================================================================
+        # Sources built as part of this dependency only contribute their headers,
+        # built dependencies are required by name
+        # ==========================================================================================
+        for name in dep.spec.requires:
+            required = specs.get(name)
+            if required is None or required.build == 'source':
+                source = Dependency.create(name, dep.root_path, required)
+                self.include_dirs.append(source.include_dir)
+            else:
+                self.requires.append(name)
+
+    @property
+    def cflags(self) -> list[str]:
+        return [f'-I{path.as_posix()}' for path in self.include_dirs]
+
+    @property
+    def libs(self) -> list[str]:
+        libs = [path.as_posix() for path in self.libraries]
+        libs += [f'-l{name}' for name in self.system_libs]
+
+        # ==========================================================================================
+        # Shared libraries are found at runtime without installing them
+        # ==========================================================================================
+        if host_platform() != 'windows' and any(is_shared(path) for path in self.libraries):
+            libs.append(f'-Wl,-rpath,{self.libraries[0].parent.as_posix()}')
+
+        return libs
+
+    def pc(self, usages: dict[str, 'Usage']) -> str:
+        prefix = self.prefix.as_posix()
+        cflags = [flag.replace(prefix, '${prefix}', 1) for flag in self.cflags]
+        libs = [flag.replace(prefix, '${prefix}', 1) for flag in self.libs]
+
+        lines = [
+            '# Written by tools/builder, do not edit',
+            f'prefix={prefix}',
+            '',
+            f'Name: {self.dep.name}',
+            f'Description: {self.dep.name}, as built into deps/{self.dep.name}',
+            f'Version: {self.version()}',
+        ]
+        requires = [name for name in self.requires if name in usages]
+        if requires:
+            lines.append(f'Requires: {" ".join(requires)}')
+        lines.append(f'Cflags: {" ".join(cflags)}')
+        if libs:
+            lines.append(f'Libs: {" ".join(libs)}')
+
+        return '\n'.join(lines) + '\n'
+
+    # Version of the installed `.pc` file of the dependency itself, if it installed one
+    def version(self) -> str:
+        for path in (self.prefix / 'build' / 'pkgconfig').glob('*.pc'):
+            try:
+                text = path.read_text()
+            except OSError:
+                continue
+
+            for line in text.splitlines():
+                if line.startswith('Version:') and line.split(':', 1)[1].strip():
+                    return line.split(':', 1)[1].strip()
+
+        return '0'
+
+
+# Static and import libraries, and shared libraries under their unversioned name
+def is_linkable(path: str) -> bool:
+    name = Path(path).name
+    return name.endswith(('.a', '.lib', '.so', '.dylib'))
+
+
+def is_shared(path: Path) -> bool:
+    return path.suffix in ('.so', '.dylib')
+
+
+def meson_string(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def meson_array(values: list[str]) -> str:
+    return '[' + ', '.join(meson_string(value) for value in values) + ']'
+
+
+# Flags of `name` and everything it requires, dependencies first in link order
+def closure(name: str, usages: dict[str, Usage], seen: set[str] | None = None) -> tuple[list[str], list[str]]:
+    seen = set() if seen is None else seen
+    if name in seen or name not in usages:
+        return [], []
+    seen.add(name)
+
+    usage = usages[name]
+    cflags, libs = list(usage.cflags), list(usage.libs)
+    for required in usage.requires:
+        required_cflags, required_libs = closure(required, usages, seen)
+        cflags += required_cflags
+        libs += required_libs
+
+    return cflags, libs
+
+
+# Replace `path` with `text`, leaving it untouched if nothing changed so meson
+# doesn't reconfigure for nothing
+def write_if_changed(path: Path, text: str):
+    try:
+        if path.read_text() == text:
+            return
+    except OSError:
+        pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+# ==================================================================================================
+# Describe every dependency published into `deps/` to the main build:
+#
+#   deps/pkgconfig/<name>.pc  pkg-config files with the exact include and library paths
+#   deps/native.ini           meson machine file listing the same flags as properties,
+#                             usable without pkg-config (`meson setup --native-file deps/native.ini`)
+#
+# Covers all dependencies in `specs` with published outputs, not only the ones built by this run.
+# ==================================================================================================
+def write_usage_files(root_path: Path, specs: dict[str, DependencySpec]):
+    usages: dict[str, Usage] = {}
+    for name, spec in sorted(specs.items()):
+        if spec.build == 'source':
+            continue
+
+        dep = Dependency.create(name, root_path, spec)
+        artifacts = Artifacts.load(dep.artifacts_path)
+        if artifacts is None or not dep.manifest_path.exists():
+            continue
+
+        usages[name] = Usage(dep, artifacts, specs)
+
+    pc_dir = pkgconfig_dir(root_path)
+    for name, usage in usages.items():
+        write_if_changed(pc_dir / f'{name}.pc', usage.pc(usages))
+
+    # generated files of dependencies that were cleaned since
+    if pc_dir.exists():
+        for path in pc_dir.glob('*.pc'):
+            if path.stem not in usages:
+                path.unlink()
+
+    lines = [
+        '# Written by tools/builder, do not edit',
+        '[built-in options]',
+        f'pkg_config_path = {meson_array([pc_dir.as_posix()])}',
+        '',
+        '[properties]',
+        f'builder_deps = {meson_array(list(usages))}',
+    ]
+    for name in usages:
+        cflags, libs = closure(name, usages)
+        lines.append(f'{name}_cflags = {meson_array(cflags)}')
+        lines.append(f'{name}_libs = {meson_array(libs)}')
+
+    write_if_changed(native_file_path(root_path), '\n'.join(lines) + '\n')
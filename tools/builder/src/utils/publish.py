@@ -0,0 +1,165 @@
+from dataclasses import replace
+from pathlib import Path
+import os
+import shutil
+import time
+import uuid
+
+from utils.types import Dependency
+
+
+# What a dependency publishes, relative to `deps/<name>`
+OUTPUTS = ['build', 'include', 'manifest.json', 'artifacts.json']
+
+# Staging directories left behind by a crashed run are removed after this many seconds
+STALE_STAGING = 24 * 60 * 60
+
+
+# Point `path` at `target`, atomically replacing whatever link was there
+def swap_link(path: Path, target: str):
+    tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}')
+    os.symlink(target, tmp, target_is_directory=True)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        os.unlink(tmp)
+        raise
+
+
+def remove(path: Path):
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.exists():
+        shutil.rmtree(path)
+
+
+class Publisher():
+    # ==============================================================================================
+    # Builds never write into the outputs other projects link against. Every build goes into
+    # a staging directory, which is published only once it's complete:
+    #
+    #   deps/<name>/versions/<id>/{build,include,manifest.json,artifacts.json}
+    #   deps/<name>/current  -> versions/<id>
+    #   deps/<name>/previous -> versions/<id of the version before>
+    #   deps/<name>/{build,include,manifest.json,artifacts.json} -> current/...
+    #
+    # Replacing the `current` link switches all outputs at once, and `previous` is kept
+    # for rollback. Without symlinks (e.g. unprivileged windows) the outputs are swapped
+    # by renames instead, which keeps the previous version in `deps/<name>/previous`.
+    # ==============================================================================================
+    def __init__(self, dep: Dependency):
+        self.dep: Dependency = dep
+
+        self.root: Path = dep.target_build_dir.parent
+        self.versions: Path = self.root / 'versions'
+        self.current: Path = self.root / 'current'
+        self.previous: Path = self.root / 'previous'
+
+    # Staging copy of the dependency, with its outputs redirected into a new version
+    def stage(self) -> Dependency:
+        path = self.versions / f'.staging-{int(time.time())}-{uuid.uuid4().hex[:8]}'
+        path.mkdir(parents=True)
+
+        return replace(self.dep, target_build_dir=path / 'build', target_include_dir=path / 'include')
+
+    def discard(self, staged: Dependency):
+        shutil.rmtree(staged.target_build_dir.parent, ignore_errors=True)
+
+    def publish(self, staged: Dependency):
+        staging = staged.target_build_dir.parent
+        version = self.versions / staging.name.removeprefix('.staging-')
+        os.rename(staging, version)
+
+        if self.can_link():
+            self.publish_link(version)
+        else:
+            self.publish_rename(version)
+
+        self.prune()
+
+    def can_link(self) -> bool:
+        probe = self.root / f'.link-{uuid.uuid4().hex}'
+        try:
+            os.symlink('versions', probe, target_is_directory=True)
+        except (OSError, NotImplementedError):
+            return False
+
+        os.unlink(probe)
+        return True
+
+    def publish_link(self, version: Path):
+        self.adopt()
+
+        previous = os.readlink(self.current) if self.current.is_symlink() else None
+        swap_link(self.current, str(version.relative_to(self.root)))
+        if previous is not None:
+            swap_link(self.previous, previous)
+
+        for name in OUTPUTS:
+            path = self.root / name
+            if not path.is_symlink():
+                swap_link(path, f'current/{name}')
+
+    def publish_rename(self, version: Path):
+        remove(self.previous)
+        self.previous.mkdir()
+
+        for name in OUTPUTS:
+            if os.path.lexists(self.root / name):
+                os.rename(self.root / name, self.previous / name)
+            if os.path.lexists(version / name):
+                os.rename(version / name, self.root / name)
+
+        shutil.rmtree(version)
+
+    # ==============================================================================================
+    # Outputs published before versioning existed become the first version,
+    # so they stay available as the previous one
+    # ==============================================================================================
+    def adopt(self):
+        if self.current.is_symlink():
+            return
+
+        legacy = [name for name in OUTPUTS
+                  if os.path.lexists(self.root / name) and not (self.root / name).is_symlink()]
+        if not legacy:
+            return
+
+        version = self.versions / f'{int(time.time())}-legacy'
+        version.mkdir(parents=True)
+        for name in legacy:
+            os.rename(self.root / name, version / name)
+
+        swap_link(self.current, str(version.relative_to(self.root)))
+
+    # Switch back to the previous version, returns False if there is none
+    def rollback(self) -> bool:
+        if not (self.current.is_symlink() and self.previous.is_symlink()):
+            return False
+
+        current = os.readlink(self.current)
+        swap_link(self.current, os.readlink(self.previous))
+        swap_link(self.previous, current)
+
+        return True
+
+    # Remove every version besides the current and previous one
+    def prune(self):
+        keep = {(self.root / os.readlink(link)).name
+                for link in (self.current, self.previous) if link.is_symlink()}
+
+        for version in self.versions.iterdir():
+            if version.name in keep:
+                continue
+
+            # ======================================================================================
+            # Another run may still be building into a recent staging directory
+            # ======================================================================================
+            if version.name.startswith('.'):
+                try:
+                    if time.time() - version.stat().st_mtime < STALE_STAGING:
+                        continue
+                except OSError:
+                    continue
+
+            shutil.rmtree(version, ignore_errors=True)
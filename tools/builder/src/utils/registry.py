@@ -0,0 +1,79 @@
+from dataclasses import fields
+from pathlib import Path
+import importlib
+import sys
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+from utils.types import DependencySpec
+
+
+# Builder class for every generic kind of dependency, as `module:Class`
+GENERIC_BUILDERS: dict[str, str] = {
+    'cmake': 'builders.cmake:CMakeBuilder',
+    'headers': 'builders.headers:HeaderBuilder',
+}
+
+BUILD_KINDS = ['cmake', 'headers', 'source', 'custom']
+
+
+# `deps.toml` next to the `src` directory of the builder
+def default_specs_path() -> Path:
+    return Path(__file__).resolve().parent.parent.parent / 'deps.toml'
+
+
+def load_specs(path: Path) -> dict[str, DependencySpec]:
+    try:
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise RuntimeError(f'failed to read dependency manifest \'{str(path)}\': {e}')
+
+    known = {f.name for f in fields(DependencySpec)}
+
+    specs: dict[str, DependencySpec] = {}
+    for name, entry in data.items():
+        unknown = set(entry) - known
+        if unknown:
+            raise RuntimeError(
+                f'[{name.upper()}]: unknown keys in dependency manifest: {", ".join(sorted(unknown))}')
+
+        spec = DependencySpec(name=name, **entry)
+        if spec.build not in BUILD_KINDS:
+            raise RuntimeError(
+                f'[{name.upper()}]: unknown build kind \'{spec.build}\'')
+        if spec.build == 'custom' and ':' not in spec.builder:
+            raise RuntimeError(
+                f'[{name.upper()}]: custom builds need a `builder = "module:Class"`')
+
+        specs[name] = spec
+
+    return specs
+
+
+# Import the builder class for `spec`, only once it's actually needed.
+# Returns None for dependencies that are only sources.
+def builder_type(spec: DependencySpec) -> type | None:
+    if spec.build == 'source':
+        return None
+
+    target = spec.builder if spec.build == 'custom' else GENERIC_BUILDERS[spec.build]
+    module, _, cls = target.partition(':')
+
+    return getattr(importlib.import_module(module), cls)
+
+
+# Construct the builder of `spec`, None for dependencies that are only sources
+def create_builder(spec: DependencySpec, root_path: Path, deps: dict, options):
+    cls = builder_type(spec)
+    if cls is None:
+        return None
+
+    # custom builders know their own name
+    if spec.build == 'custom':
+        return cls(root_path, deps, options)
+
+    return cls(root_path, deps, spec.name, options)
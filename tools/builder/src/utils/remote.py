@@ -0,0 +1,356 @@
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+import json
+import os
+import socket
+import struct
+import tarfile
+import tempfile
+import threading
+
+from utils.bundle import digest_path, extract, pack, unpack
+from utils.fingerprint import IGNORED_DIRS
+from utils.manifest import Manifest
+from utils.trace import Span
+from utils.types import Dependency
+
+
+# Every message is a 4 byte big-endian length followed by that much JSON,
+# a `blob` message is followed by `size` raw bytes
+HEADER = struct.Struct('>I')
+
+# Largest JSON message accepted, blobs aren't limited
+MAX_MESSAGE = 16 << 20
+
+# Seconds without hearing from a worker before it's given up on.
+# Workers send a heartbeat every `HEARTBEAT` seconds while building.
+IDLE_TIMEOUT = 60.0
+HEARTBEAT = 10.0
+
+# Seconds to wait for a worker to answer a status request
+STATUS_TIMEOUT = 2.0
+
+# Build options a worker builds with, the ones that change the build configuration
+REMOTE_OPTIONS = ['checksum', 'stage_mode', 'generator', 'unity', 'unity_batch', 'pch', 'shared', 'lto']
+
+
+# ==================================================================================================
+# Worker addresses: `tcp://host:port`, `host:port` or `unix:///path/to/socket`
+# ==================================================================================================
+def parse_address(address: str) -> tuple[int, Any]:
+    url = urlparse(address if '://' in address else f'tcp://{address}')
+    if url.scheme == 'unix':
+        if not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError(f'unix sockets are not supported here: \'{address}\'')
+
+        return socket.AF_UNIX, url.path
+
+    if url.scheme == 'tcp' and url.hostname and url.port:
+        return socket.AF_INET6 if ':' in url.hostname else socket.AF_INET, (url.hostname, url.port)
+
+    raise RuntimeError(f'invalid worker address \'{address}\', use tcp://host:port or unix:///path')
+
+
+def connect(address: str, timeout: float) -> 'Channel':
+    family, target = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        raise
+
+    return Channel(sock)
+
+
+def listen(address: str) -> socket.socket:
+    family, target = parse_address(address)
+    if family == getattr(socket, 'AF_UNIX', None) and os.path.exists(target):
+        # left behind by a worker that didn't shut down cleanly
+        os.unlink(target)
+
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family != getattr(socket, 'AF_UNIX', None):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(target)
+    sock.listen()
+
+    return sock
+
+
+class Channel():
+    # ==============================================================================================
+    # Both ends of a worker connection. Messages may be sent from several threads,
+    # e.g. build progress next to heartbeats, but are only received by one.
+    # ==============================================================================================
+    def __init__(self, sock: socket.socket):
+        self.sock: socket.socket = sock
+        self.lock = threading.Lock()
+
+    def send(self, message: dict):
+        data = json.dumps(message).encode()
+        with self.lock:
+            self.sock.sendall(HEADER.pack(len(data)) + data)
+
+    def recv(self) -> dict:
+        size, = HEADER.unpack(self.read(HEADER.size))
+        if size > MAX_MESSAGE:
+            raise ConnectionError(f'message of {size} bytes exceeds the limit')
+
+        try:
+            return json.loads(self.read(size))
+        except ValueError as e:
+            raise ConnectionError(f'malformed message: {e}')
+
+    # Receive the next message, which has to be of `type`
+    def expect(self, type: str) -> dict:
+        message = self.recv()
+        if message.get('type') != type:
+            raise ConnectionError(f'expected a \'{type}\' message, got \'{message.get("type")}\'')
+
+        return message
+
+    def send_file(self, path: Path, **fields):
+        size = path.stat().st_size
+        with self.lock:
+            data = json.dumps({'type': 'blob', 'size': size, **fields}).encode()
+            self.sock.sendall(HEADER.pack(len(data)) + data)
+            with open(path, 'rb') as f:
+                self.sock.sendfile(f)
+
+    # Receive a blob into `path`, returns its message
+    def recv_file(self, path: Path) -> dict:
+        message = self.expect('blob')
+
+        remaining = message['size']
+        with open(path, 'wb') as f:
+            while remaining > 0:
+                chunk = self.sock.recv(min(remaining, 1 << 20))
+                if not chunk:
+                    raise ConnectionError('connection closed in the middle of a blob')
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        return message
+
+    def read(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection closed')
+            data += chunk
+
+        return bytes(data)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# Archive the source tree of a dependency into `path`, leaving out what isn't part of it
+def snapshot(source_dir: Path, path: Path):
+    def exclude(info: tarfile.TarInfo) -> tarfile.TarInfo | None:
+        if any(part in IGNORED_DIRS for part in Path(info.name).parts):
+            return None
+        return info
+
+    with tarfile.open(path, 'w:gz', compresslevel=1) as tar:
+        tar.add(source_dir, '.', filter=exclude)
+
+
+def extract_snapshot(path: Path, dst: Path):
+    with tarfile.open(path, 'r:gz') as tar:
+        extract(tar, dst)
+
+
+# `.tar.zst` or `.tar.xz`, bundles are renamed after the transfer
+def bundle_suffix(path: Path) -> str:
+    return ''.join(path.suffixes[-2:])
+
+
+def bundle_digest(path: Path) -> str:
+    return digest_path(path).read_text().split()[0]
+
+
+# Store a received bundle under `<name><suffix>` next to its digest, see `utils.bundle.unpack`
+def received_bundle(blob: Path, name: str, message: dict) -> Path:
+    path = blob.with_name(f'{name}{message["suffix"]}')
+    os.replace(blob, path)
+    digest_path(path).write_text(f'{message["digest"]}  {path.name}\n')
+
+    return path
+
+
+# Dependency and everything it requires, transitively
+def closure(name: str, deps: dict[str, Dependency]) -> list[str]:
+    names: list[str] = []
+    pending = [name]
+    while pending:
+        current = pending.pop(0)
+        if current in names or current not in deps:
+            continue
+
+        names.append(current)
+        pending.extend(deps[current].requires)
+
+    return names
+
+
+class WorkerPool():
+    # ==============================================================================================
+    # Farms dependency builds out to worker daemons (see `worker.py`):
+    #
+    #   -> build    dependency spec, source fingerprints, manifest and build options
+    #   <- need     source snapshots and required outputs the worker doesn't have yet
+    #   -> blob     one per needed snapshot or bundle
+    #   <- progress status lines of the remote builder, and heartbeats
+    #   <- result   success or the error, followed by the bundle of the outputs and the log
+    #
+    # Workers are picked by their load, only if they have a free slot and the same toolchain,
+    # since the outputs are stored under a manifest key covering the local toolchain.
+    #
+    # Builders beyond the local `local_slots` only run on workers, builds falling back to this
+    # host wait in `local` for one of the slots the jobserver and CPU split were sized for.
+    # ==============================================================================================
+    def __init__(self, addresses: list[str], toolchain: str, local_slots: int):
+        self.addresses: list[str] = addresses
+        self.toolchain: str = toolchain
+        self.local = threading.BoundedSemaphore(max(1, local_slots))
+
+    def status(self, address: str) -> dict | None:
+        try:
+            with connect(address, STATUS_TIMEOUT) as channel:
+                channel.send({'type': 'status'})
+                return channel.expect('status')
+        except (OSError, ConnectionError):
+            return None
+
+    # Builds the reachable workers with this toolchain can run at the same time
+    def slots(self) -> int:
+        statuses = [self.status(address) for address in self.addresses]
+        return sum(status['slots'] for status in statuses
+                   if status is not None and status.get('toolchain') == self.toolchain)
+
+    # Workers able to take a build right now, least loaded first
+    def candidates(self) -> list[str]:
+        loads: list[tuple[float, str]] = []
+        for address in self.addresses:
+            status = self.status(address)
+            if status is None or status.get('toolchain') != self.toolchain:
+                continue
+
+            if status['running'] < status['slots']:
+                loads.append((status['running'] / status['slots'], address))
+
+        return [address for _, address in sorted(loads)]
+
+    # Build the staged outputs of `builder` on a worker.
+    # Returns False if no worker could, the dependency is then built locally.
+    def build(self, builder, staged: Dependency, manifest: Manifest, deps: dict[str, Dependency]) -> bool:
+        tag = f'[{builder.name.upper()}]'
+
+        for address in self.candidates():
+            try:
+                with tempfile.TemporaryDirectory(prefix='builder-remote-') as tmp:
+                    built, error = self.build_on(address, builder, staged, manifest, deps, Path(tmp))
+            except (OSError, ConnectionError) as e:
+                builder.log(f'{tag}: worker {address} failed: {e}')
+                continue
+
+            if built:
+                builder.log(f'{tag}: built on {address}')
+                return True
+
+            if error is None:
+                # its slots filled up since it was asked
+                continue
+
+            builder.log(f'{tag}: build on {address} failed, building locally\n{error}')
+            return False
+
+        return False
+
+    def build_on(self, address: str, builder, staged: Dependency, manifest: Manifest,
+                 deps: dict[str, Dependency], tmp: Path) -> tuple[bool, str | None]:
+        name = builder.name
+        names = closure(name, deps)
+
+        sources = {n: deps[n].fingerprint() for n in names if deps[n].source_dir.exists()}
+        outputs: dict[str, str] = {}
+        for n in names:
+            required = Manifest.load(deps[n].manifest_path) if n != name else None
+            if required is not None:
+                outputs[n] = required.key()
+
+        with connect(address, IDLE_TIMEOUT) as channel:
+            channel.send({
+                'type': 'build',
+                'name': name,
+                'specs': {n: asdict(deps[n].spec) for n in names},
+                'sources': sources,
+                'outputs': outputs,
+                'manifest': asdict(manifest),
+                'key': manifest.key(),
+                'toolchain': self.toolchain,
+                'options': {option: getattr(builder.options, option) for option in REMOTE_OPTIONS},
+            })
+
+            reply = channel.recv()
+            if reply.get('type') == 'busy':
+                return False, None
+            if reply.get('type') != 'need':
+                raise ConnectionError(f'unexpected reply \'{reply.get("type")}\'')
+
+            # ======================================================================================
+            # Send what the worker doesn't have from an earlier build
+            # ======================================================================================
+            for n in reply['sources']:
+                path = tmp / f'{n}.tar.gz'
+                snapshot(deps[n].source_dir, path)
+                channel.send_file(path, name=n, kind='source', fingerprint=sources[n])
+                path.unlink()
+
+            for n in reply['outputs']:
+                path = pack(deps[n], outputs[n], tmp / 'outputs')
+                channel.send_file(path, name=n, kind='outputs', key=outputs[n],
+                                  suffix=bundle_suffix(path), digest=bundle_digest(path))
+
+            # ======================================================================================
+            # Relay the remote builder's progress until it's done
+            # ======================================================================================
+            while True:
+                message = channel.recv()
+                if message.get('type') == 'progress':
+                    builder.options.progress.put((name, message['text'], message['persistent']))
+                elif message.get('type') == 'result':
+                    break
+                elif message.get('type') != 'alive':
+                    raise ConnectionError(f'unexpected message \'{message.get("type")}\'')
+
+            builder.tracer.spans += [Span(**span) for span in message.get('spans', [])]
+
+            builder.log_path.parent.mkdir(parents=True, exist_ok=True)
+            channel.recv_file(builder.log_path)
+
+            if not message['ok']:
+                return False, message.get('error') or 'unknown error'
+
+            # ======================================================================================
+            # The bundle is verified against the digest and manifest key like any other
+            # ======================================================================================
+            blob = tmp / 'bundle'
+            path = received_bundle(blob, name, channel.recv_file(blob))
+            if not unpack(path, staged, manifest.key()):
+                raise ConnectionError('received a corrupt bundle')
+
+        return True, None
+
@@ -0,0 +1,253 @@
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable
+import heapq
+import itertools
+import os
+
+
+# Split the machine's CPUs between `width` concurrently running builds,
+# so N parallel cmake/msbuild invocations don't oversubscribe the machine
+def split_cpus(width: int) -> int:
+    cpus: int = os.cpu_count() or 1
+
+    return max(1, cpus // max(1, width))
+
+
+# Split `cpus` between concurrently running builds by their estimated cost: a build gets the
+# share of its cost among itself and the `width - 1` costliest others it may run alongside.
+# Builds without an estimate get an equal share.
+def weighted_cpus(costs: dict[str, float | None], width: int, cpus: int = None) -> dict[str, int]:
+    cpus = cpus or os.cpu_count() or 1
+    equal = max(1, cpus // max(1, width))
+
+    known = sorted((cost for cost in costs.values() if cost), reverse=True)
+    shares: dict[str, int] = {}
+    for name, cost in costs.items():
+        if not cost:
+            shares[name] = equal
+            continue
+
+        others = list(known)
+        others.remove(cost)
+        total = cost + sum(others[:max(0, width - 1)])
+        shares[name] = min(cpus, max(1, round(cpus * cost / total)))
+
+    return shares
+
+
+# Seconds between asking again whether held back nodes may start
+ADMIT_INTERVAL = 1.0
+
+
+class Scheduler():
+    def __init__(self, graph: dict[str, list[str]], jobs: int, costs: dict[str, float] = None,
+                 admit: Callable[[str, list[str]], bool] = None):
+        # ==============================================================================================
+        # `graph` maps every node onto the nodes it depends on, `costs` onto how long it's
+        # expected to run. Nodes on the longest remaining path are started first.
+        # `admit(node, running)` may hold back a ready node while the others are running,
+        # it's asked again every `ADMIT_INTERVAL` seconds.
+        # ==============================================================================================
+        self.graph: dict[str, list[str]] = graph
+        self.jobs: int = max(1, jobs)
+        self.costs: dict[str, float] = costs or {}
+        self.admit: Callable[[str, list[str]], bool] = admit or (lambda name, running: True)
+
+        self.executor: Callable[[int], Executor] = ThreadPoolExecutor
+
+    def dependents(self) -> dict[str, list[str]]:
+        dependents: dict[str, list[str]] = {name: [] for name in self.graph}
+        for name, edges in self.graph.items():
+            for edge in edges:
+                if edge not in self.graph:
+                    raise RuntimeError(
+                        f'\'{name}\' depends on unknown dependency \'{edge}\'')
+
+                dependents[edge].append(name)
+
+        return dependents
+
+    # Topologically sort the graph, keeping the insertion order among independent nodes
+    def order(self) -> list[str]:
+        dependents = self.dependents()
+        indegree: dict[str, int] = {
+            name: len(edges) for name, edges in self.graph.items()}
+
+        ready = deque(name for name, count in indegree.items() if count == 0)
+        order: list[str] = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+
+            for dependent in dependents[name]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) != len(self.graph):
+            cycle = [name for name, count in indegree.items() if count > 0]
+            raise RuntimeError(
+                f'dependency cycle between: {", ".join(cycle)}')
+
+        return order
+
+    # Cost of the longest chain of nodes starting at every node, the node itself included
+    def critical_paths(self) -> dict[str, float]:
+        dependents = self.dependents()
+
+        paths: dict[str, float] = {}
+        for name in reversed(self.order()):
+            paths[name] = self.costs.get(name, 0.0) + max(
+                (paths[dependent] for dependent in dependents[name]), default=0.0)
+
+        return paths
+
+    # The chain of nodes the graph can't be finished faster than
+    def critical_path(self) -> list[str]:
+        paths = self.critical_paths()
+        dependents = self.dependents()
+
+        chain: list[str] = []
+        candidates = [name for name, edges in self.graph.items() if not edges]
+        while candidates:
+            name = max(candidates, key=lambda candidate: paths[candidate])
+            chain.append(name)
+            candidates = dependents[name]
+
+        return chain
+
+    # Wall time of running the graph with `jobs` slots, if every node takes its cost
+    def predict(self) -> float:
+        dependents = self.dependents()
+        indegree: dict[str, int] = {
+            name: len(edges) for name, edges in self.graph.items()}
+
+        ready = ReadyQueue(self.critical_paths())
+        for name, count in indegree.items():
+            if count == 0:
+                ready.push(name)
+
+        now = 0.0
+        running: list[tuple[float, int, str]] = []
+        sequence = itertools.count()
+        while ready or running:
+            while ready and len(running) < self.jobs:
+                name = ready.pop()
+                heapq.heappush(running, (now + self.costs.get(name, 0.0), next(sequence), name))
+
+            now, _, name = heapq.heappop(running)
+            for dependent in dependents[name]:
+                indegree[dependent] -= 1
+                if indegree[dependent] == 0:
+                    ready.push(dependent)
+
+        return now
+
+    # Maximum number of nodes that can ever run at the same time
+    def width(self) -> int:
+        return max(1, min(self.jobs, len(self.graph)))
+
+    # Run `task(name, *args)` for every node, starting each one as soon as
+    # everything it depends on has finished. The first failure stops scheduling
+    # new nodes, lets running ones finish, and is then re-raised. An interrupt is re-raised at once.
+    # Returns what `task` returned for every node.
+    def run(self, task: Callable[..., Any], *args: Any) -> dict[str, Any]:
+        # validates the graph before anything is started
+        self.order()
+
+        dependents = self.dependents()
+        indegree: dict[str, int] = {
+            name: len(edges) for name, edges in self.graph.items()}
+
+        ready = ReadyQueue(self.critical_paths())
+        for name, count in indegree.items():
+            if count == 0:
+                ready.push(name)
+
+        running: dict = {}
+        results: dict[str, Any] = {}
+        failure: BaseException | None = None
+
+        # ==========================================================================================
+        # An interrupt doesn't wait for the running nodes, whose build tools were interrupted too
+        # ==========================================================================================
+        pool = self.executor(self.width())
+        try:
+            while ready or running:
+                held = False
+                while ready and failure is None and len(running) < self.jobs:
+                    name = ready.pop_first(lambda name: self.admit(name, list(running.values())))
+                    if name is None:
+                        held = True
+                        break
+
+                    running[pool.submit(task, name, *args)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, timeout=ADMIT_INTERVAL if held else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+
+                    error = future.exception()
+                    if error is not None:
+                        if failure is None:
+                            failure = error
+                        continue
+
+                    results[name] = future.result()
+
+                    for dependent in dependents[name]:
+                        indegree[dependent] -= 1
+                        if indegree[dependent] == 0:
+                            ready.push(dependent)
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+        pool.shutdown()
+
+        if failure is not None:
+            raise failure
+
+        return results
+
+
+class ReadyQueue():
+    # ==============================================================================================
+    # Nodes ready to run, the one with the highest priority first,
+    # in the order they became ready among equal priorities
+    # ==============================================================================================
+    def __init__(self, priorities: dict[str, float]):
+        self.priorities: dict[str, float] = priorities
+        self.heap: list[tuple[float, int, str]] = []
+        self.sequence = itertools.count()
+
+    def push(self, name: str):
+        heapq.heappush(self.heap, (-self.priorities.get(name, 0.0), next(self.sequence), name))
+
+    def pop(self) -> str:
+        return heapq.heappop(self.heap)[2]
+
+    # Pop the first node `admit` accepts, None if it accepts none
+    def pop_first(self, admit: Callable[[str], bool]) -> str | None:
+        skipped: list[tuple[float, int, str]] = []
+        found: str | None = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if admit(entry[2]):
+                found = entry[2]
+                break
+
+            skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+
+        return found
+
+    def __bool__(self) -> bool:
+        return bool(self.heap)
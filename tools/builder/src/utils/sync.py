@@ -0,0 +1,218 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+import filecmp
+import os
+import shutil
+import uuid
+
+from utils.files import reflink
+
+
+# Ways of placing staged files, see `resolve_stage_mode`
+STAGE_MODES = ['copy', 'hardlink', 'symlink', 'reflink']
+
+
+@dataclass
+class SyncStats(object):
+    copied: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    bytes: int = 0
+
+    def __iadd__(self, other):
+        self.copied += other.copied
+        self.removed += other.removed
+        self.unchanged += other.unchanged
+        self.bytes += other.bytes
+        return self
+
+    def __str__(self) -> str:
+        return (f'{self.copied} copied, {self.removed} removed, '
+                f'{self.unchanged} unchanged ({self.bytes / 1024:.1f} KiB)')
+
+
+# Whether `dst` already holds the contents of `src`. By default files with the same size
+# and mtime are equal, with `checksum` the contents of same-sized files are compared instead
+def same_file(src: str, src_st: os.stat_result, dst: str, dst_st: os.stat_result, checksum: bool, mode: str = 'copy') -> bool:
+    if mode == 'hardlink':
+        return os.path.samestat(src_st, dst_st)
+
+    if src_st.st_size != dst_st.st_size:
+        return False
+
+    if checksum:
+        return filecmp.cmp(src, dst, shallow=False)
+
+    return src_st.st_mtime_ns == dst_st.st_mtime_ns
+
+
+# Place `src` at a temporary name and rename it over `dst`, so a concurrent reader
+# never sees a partial file and hardlinks to the old contents are left alone
+def replace_file(src: str, dst: str, mode: str = 'copy'):
+    tmp = f'{dst}.sync-tmp'
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+
+    if mode == 'hardlink':
+        os.link(src, tmp)
+    elif mode != 'reflink' or not reflink(src, tmp):
+        shutil.copy2(src, tmp)
+
+    os.replace(tmp, dst)
+
+
+def remove(entry: os.DirEntry):
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path)
+    else:
+        os.unlink(entry.path)
+
+
+# Make `dst` mirror `src`: copy new and changed files, remove stale ones,
+# and leave unchanged files (and their mtimes) untouched
+def sync_tree(src: Path, dst: Path, ignore: Callable | None = None, checksum: bool = False, mode: str = 'copy') -> SyncStats:
+    stats = SyncStats()
+
+    src = str(src)
+    dst = str(dst)
+
+    # a previous run may have staged `dst` as a symlink into the sources
+    if os.path.islink(dst):
+        os.unlink(dst)
+    if not os.path.isdir(src):
+        # ==========================================================================================
+        # Single file
+        # ==========================================================================================
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+
+        if os.path.lexists(dst):
+            if same_file(src, os.stat(src), dst, os.lstat(dst), checksum, mode):
+                stats.unchanged += 1
+                return stats
+
+        replace_file(src, dst, mode)
+        stats.copied += 1
+        stats.bytes += os.stat(dst).st_size
+        return stats
+
+    os.makedirs(dst, exist_ok=True)
+
+    with os.scandir(src) as it:
+        src_entries = {entry.name: entry for entry in it}
+    with os.scandir(dst) as it:
+        dst_entries = {entry.name: entry for entry in it}
+
+    ignored = set()
+    if ignore is not None:
+        ignored = set(ignore(src, list(src_entries.keys())))
+
+    # ==============================================================================================
+    # Remove anything that no longer exists (or is now ignored) in `src`
+    # ==============================================================================================
+    for name, entry in dst_entries.items():
+        source = src_entries.get(name)
+        stale = source is None or name in ignored
+        if not stale:
+            stale = source.is_dir() != entry.is_dir(follow_symlinks=False)
+
+        if stale:
+            remove(entry)
+            stats.removed += 1
+
+    for name, entry in src_entries.items():
+        if name in ignored:
+            continue
+
+        target = os.path.join(dst, name)
+        if entry.is_dir():
+            stats += sync_tree(entry.path, target, ignore, checksum, mode)
+            continue
+
+        existing = dst_entries.get(name)
+        if existing is not None and os.path.lexists(target):
+            if same_file(entry.path, entry.stat(), target, existing.stat(follow_symlinks=False), checksum, mode):
+                stats.unchanged += 1
+                continue
+
+        replace_file(entry.path, target, mode)
+        stats.copied += 1
+        stats.bytes += entry.stat().st_size
+
+    return stats
+
+
+def existing_parent(path: Path) -> Path:
+    path = Path(path).absolute()
+    while not path.exists():
+        path = path.parent
+
+    return path
+
+
+def first_file(path: Path) -> Path | None:
+    for dirpath, _, filenames in os.walk(path):
+        if filenames:
+            return Path(dirpath) / filenames[0]
+
+    return None
+
+
+# Check whether `mode` can stage `src` into `dst` on this filesystem,
+# falling back to a plain copy if it can't
+def resolve_stage_mode(mode: str, src: Path, dst: Path) -> str:
+    if mode == 'copy':
+        return mode
+
+    parent = existing_parent(dst)
+    probe = parent / f'.stage-probe-{uuid.uuid4().hex}'
+    try:
+        if mode == 'hardlink':
+            if os.stat(src).st_dev != os.stat(parent).st_dev:
+                return 'copy'
+        elif mode == 'symlink':
+            os.symlink(Path(src).absolute(), probe, target_is_directory=True)
+        elif mode == 'reflink':
+            sample = first_file(src)
+            if sample is None or not reflink(sample, probe):
+                return 'copy'
+    except OSError:
+        return 'copy'
+    finally:
+        if os.path.lexists(probe):
+            os.unlink(probe)
+
+    return mode
+
+
+# Stage `src` into `dst` using `mode`: `symlink` links the whole tree, every
+# other mode mirrors it file by file
+def stage_tree(src: Path, dst: Path, mode: str = 'copy', checksum: bool = False) -> SyncStats:
+    if mode != 'symlink':
+        return sync_tree(src, dst, checksum=checksum, mode=mode)
+
+    stats = SyncStats()
+
+    target = Path(src).absolute()
+    if os.path.islink(dst) and Path(os.readlink(dst)) == target:
+        stats.unchanged += 1
+        return stats
+
+    if os.path.islink(dst):
+        os.unlink(dst)
+    elif os.path.isdir(dst):
+        shutil.rmtree(dst)
+        stats.removed += 1
+
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = f'{dst}.sync-tmp'
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+
+    os.symlink(target, tmp, target_is_directory=True)
+    os.replace(tmp, dst)
+
+    stats.copied += 1
+    return stats
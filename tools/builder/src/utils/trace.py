@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+import json
+import time
+
+
+@dataclass
+class Span(object):
+    dep: str
+    name: str
+    category: str
+    start: float
+    end: float
+
+    # Row of the dependency the span is drawn on, parallel compile jobs get their own
+    lane: int = 0
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Tracer():
+    # ==============================================================================================
+    # Records how long each phase of a builder takes. Spans use wall clock time,
+    # so spans recorded in different worker processes line up in one trace.
+    # ==============================================================================================
+    def __init__(self, dep: str):
+        self.dep: str = dep
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, category: str = 'phase', **args):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.spans.append(
+                Span(self.dep, name, category, start, time.time(), 0, args))
+
+
+# Size of `.ninja_log` before a build, so only the entries it appends are ingested
+def ninja_log_size(build_dir: Path) -> int:
+    try:
+        return (build_dir / '.ninja_log').stat().st_size
+    except OSError:
+        return 0
+
+
+# Turn the entries a ninja run appended to `.ninja_log` into spans, `start` being the
+# time ninja was started. Overlapping jobs are spread over lanes, one per concurrent job.
+def ninja_spans(build_dir: Path, dep: str, start: float, offset: int = 0) -> list[Span]:
+    path = build_dir / '.ninja_log'
+    try:
+        with open(path, 'rb') as f:
+            if offset <= path.stat().st_size:
+                f.seek(offset)
+            text = f.read().decode(errors='replace')
+    except OSError:
+        return []
+
+    entries: list[tuple[int, int, str]] = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+
+        fields = line.split('\t')
+        if len(fields) < 4:
+            continue
+
+        entries.append((int(fields[0]), int(fields[1]), fields[3]))
+
+    spans: list[Span] = []
+    lanes: list[int] = []
+    for begin, end, output in sorted(entries):
+        lane = next((i for i, free in enumerate(lanes) if free <= begin), len(lanes))
+        if lane == len(lanes):
+            lanes.append(0)
+        lanes[lane] = end
+
+        spans.append(Span(dep, output, 'ninja', start + begin / 1000,
+                          start + end / 1000, lane + 1))
+
+    return spans
+
+
+def chrome_trace(spans: list[Span]) -> dict:
+    events: list[dict] = []
+    threads: dict[tuple[str, int], int] = {}
+
+    for span in sorted(spans, key=lambda s: (s.dep, s.lane, s.start)):
+        if (span.dep, span.lane) not in threads:
+            tid = len(threads) + 1
+            threads[(span.dep, span.lane)] = tid
+
+            label = span.dep if span.lane == 0 else f'{span.dep} (job {span.lane})'
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                           'args': {'name': label}})
+
+    origin = min((span.start for span in spans), default=0.0)
+    for span in spans:
+        events.append({
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round((span.start - origin) * 1e6),
+            'dur': round(span.duration * 1e6),
+            'pid': 1,
+            'tid': threads[(span.dep, span.lane)],
+            'args': {'dependency': span.dep, **span.args},
+        })
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write_chrome_trace(spans: list[Span], path: Path):
+    Path(path).write_text(json.dumps(chrome_trace(spans)))
+
+
+# Table of every builder phase sorted by wall time, followed by the slowest compile jobs
+# and how well the compiler launcher did for each dependency
+def summary(spans: list[Span], slowest: int = 10) -> str:
+    phases = sorted((s for s in spans if s.category == 'phase'),
+                    key=lambda s: s.duration, reverse=True)
+    jobs = sorted((s for s in spans if s.category == 'ninja'),
+                  key=lambda s: s.duration, reverse=True)
+    launchers = sorted((s for s in spans if s.category == 'launcher'), key=lambda s: s.dep)
+    memory = sorted((s for s in spans if s.category == 'memory'),
+                    key=lambda s: s.args['peak'], reverse=True)
+
+    lines: list[str] = [f'{"dependency":<12} {"phase":<16} {"wall time":>10}']
+    for span in phases:
+        lines.append(f'{span.dep:<12} {span.name:<16} {span.duration:>9.2f}s')
+
+    if jobs:
+        lines.append('')
+        lines.append(f'{"dependency":<12} {"slowest compile jobs":<52} {"wall time":>10}')
+        for span in jobs[:slowest]:
+            lines.append(f'{span.dep:<12} {span.name[-52:]:<52} {span.duration:>9.2f}s')
+
+    if launchers:
+        lines.append('')
+        lines.append(f'{"dependency":<12} {"launcher":<16} {"hits":>6} {"misses":>6} {"hit rate":>9}')
+        for span in launchers:
+            hits, misses = span.args['hits'], span.args['misses']
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'{span.dep:<12} {span.name:<16} {hits:>6} {misses:>6} {rate:>9.0%}')
+
+    if memory:
+        lines.append('')
+        lines.append(f'{"dependency":<12} {"peak memory":>11}')
+        for span in memory:
+            lines.append(f'{span.dep:<12} {span.args["peak"] >> 20:>7} MiB')
+
+    return '\n'.join(lines)
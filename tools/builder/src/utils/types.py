@@ -1,5 +1,39 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
+
+from utils.fingerprint import fingerprint_tree
+from utils.jobserver import JobserverAuth
+
+
+@dataclass
+class DependencySpec(object):
+    # One entry of `deps.toml`, see the comment at its top
+    name: str
+    source: str
+    build: str = 'cmake'
+    include: str = 'include'
+    builder: str = ''
+    requires: list[str] = field(default_factory=list)
+    options: dict[str, str] = field(default_factory=dict)
+    targets: list[str] = field(default_factory=list)
+    artifacts: list[str] = field(default_factory=list)
+
+    # Whether the sources survive being compiled as unity batches
+    unity: bool = True
+
+    # Headers precompiled for the C++ sources of every target, when precompiled headers are enabled
+    pch: list[str] = field(default_factory=list)
+
+    # Memory the build needs at its peak in MiB, until it was measured to need more
+    memory: int = 0
+
+    # System libraries linked along with the dependency, per host platform
+    system_libs: dict[str, list[str]] = field(default_factory=dict)
+
+    @property
+    def header_only(self) -> bool:
+        return self.build == 'headers'
 
 
 @dataclass
@@ -15,6 +49,37 @@ class Dependency(object):
 
     built: bool
 
+    # Names of the dependencies that have to be present before this one is built
+    requires: list[str] = field(default_factory=list)
+
+    # Header-only dependencies never produce a build directory
+    header_only: bool = False
+
+    spec: DependencySpec | None = None
+
+    @property
+    def source_dir(self) -> Path:
+        return self.build_dir.parent
+
+    # Describes the sources, toolchain and options the current outputs were built from
+    @property
+    def manifest_path(self) -> Path:
+        return self.target_build_dir.parent / 'manifest.json'
+
+    # Lists the libraries, headers and config files the outputs consist of
+    @property
+    def artifacts_path(self) -> Path:
+        return self.target_build_dir.parent / 'artifacts.json'
+
+    # Hashes of the source files, so unchanged files aren't read again by `fingerprint`
+    @property
+    def stat_cache_path(self) -> Path:
+        return self.root_path / 'deps' / '.fingerprints' / f'{self.name}.json'
+
+    # Hash of the sources, see `utils.fingerprint.fingerprint_tree`
+    def fingerprint(self) -> str:
+        return fingerprint_tree(self.source_dir, self.stat_cache_path)
+
     def exists(self) -> bool:
         if self.build_dir.parent.exists():
             return True
@@ -22,7 +87,7 @@ def exists(self) -> bool:
         return False
 
     def is_built(self) -> bool:
-        tbd = self.target_build_dir.exists()
+        tbd = self.header_only or self.target_build_dir.exists()
         tid = self.target_include_dir.exists()
 
         if self.built and tbd and tid:
@@ -31,9 +96,12 @@ def is_built(self) -> bool:
         return False
 
     @staticmethod
-    def create(name: str, root_path: Path):
-        build_dir: Path = root_path / 'vendor' / name / 'build'
-        include_dir: Path = root_path / 'vendor' / name / 'include'
+    def create(name: str, root_path: Path, spec: DependencySpec = None):
+        if spec is None:
+            spec = DependencySpec(name, f'vendor/{name}')
+
+        build_dir: Path = root_path / spec.source / 'build'
+        include_dir: Path = root_path / spec.source / spec.include
 
         target_build_dir: Path = root_path / 'deps' / name / 'build'
         target_include_dir: Path = root_path / 'deps' / name / 'include'
@@ -42,5 +110,65 @@ def create(name: str, root_path: Path):
             name, root_path,
             build_dir, include_dir,
             target_build_dir, target_include_dir,
-            built=False
+            built=False,
+            requires=list(spec.requires),
+            header_only=spec.header_only,
+            spec=spec
         )
+
+
+@dataclass
+class BuildOptions(object):
+    # Number of CPUs a single builder may hand to its build tool,
+    # unless `cpu_shares` has a share for the dependency
+    cpus: int = 1
+    cpu_shares: dict[str, int] = field(default_factory=dict)
+
+    # Shared artifact store, disabled if `cache_dir` is None
+    cache_dir: Path | None = None
+    cache_size: int = 10 << 30
+
+    # Compare file contents instead of size and mtime when staging headers
+    checksum: bool = False
+
+    # How headers are staged: copy, hardlink, symlink or reflink
+    stage_mode: str = 'copy'
+
+    # CMake generator, picked for the host platform if empty
+    generator: str = ''
+
+    # Compile CMake projects as unity batches of `unity_batch` sources,
+    # trading incremental rebuilds for cold build throughput
+    unity: bool = False
+    unity_batch: int = 16
+
+    # Precompile the `pch` headers listed for the dependency if True, disable precompiled
+    # headers entirely if False, leave the project's own setup alone if None
+    pch: bool | None = None
+
+    # Build shared instead of static libraries, and with link-time optimization
+    shared: bool = False
+    lto: bool = False
+
+    # ccache or sccache executable compilers are launched through, none if empty,
+    # and the cache directory it uses
+    launcher: str = ''
+    launcher_dir: Path | None = None
+
+    # Detect the toolchain once and seed every new CMake build tree with the results
+    toolchain_cache: bool = True
+
+    # Where CMake build trees and toolchain probes are kept, `<root>/.buildcache` if None
+    build_cache_dir: Path | None = None
+
+    # Concurrent link steps of Ninja builds, unlimited if 0
+    link_jobs: int = 0
+
+    # Tracks the memory use of running builders, see `utils.memory.MemoryMonitor`
+    memory: Any = None
+
+    # Jobserver shared by all child build tools, if the platform supports one
+    jobserver: JobserverAuth | None = None
+
+    # Queue feeding the live progress display, output is printed directly if None
+    progress: Any = None
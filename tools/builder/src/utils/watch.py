@@ -0,0 +1,228 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+import ctypes
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from utils.fingerprint import IGNORED_DIRS
+from utils.types import Dependency
+
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# `struct inotify_event` without the trailing name
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def ignored(path: Path) -> bool:
+    return any(part in IGNORED_DIRS for part in path.parts)
+
+
+class Watcher(ABC):
+    # ==============================================================================================
+    # Reports changes below a set of source trees, skipping the directories
+    # that are never part of a source tree (see `utils.fingerprint.IGNORED_DIRS`)
+    # ==============================================================================================
+    def __init__(self, roots: list[Path]):
+        self.roots: list[Path] = roots
+
+    # Block until something changes, then keep collecting changes until none happened
+    # for `debounce` seconds, so a checkout or patch is reported as a single burst
+    @abstractmethod
+    def wait(self, debounce: float) -> set[Path]:
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, roots: list[Path]):
+        super().__init__(roots)
+
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd: int = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.watches: dict[int, Path] = {}
+        try:
+            for root in roots:
+                self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    # inotify isn't recursive, every directory gets a watch of its own
+    def add_tree(self, path: Path):
+        for dirpath, dirnames, _ in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed on \'{dirpath}\'')
+
+            self.watches[wd] = Path(dirpath)
+
+    def read_events(self) -> set[Path]:
+        changes: set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changes
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+                offset += EVENT_HEADER.size + length
+
+                # ==================================================================================
+                # Events were dropped, anything may have changed
+                # ==================================================================================
+                if mask & IN_Q_OVERFLOW:
+                    changes.update(self.roots)
+                    continue
+
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+
+                if wd not in self.watches:
+                    continue
+
+                path = self.watches[wd] / os.fsdecode(name.rstrip(b'\0'))
+                if ignored(path):
+                    continue
+
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self.add_tree(path)
+                    except OSError:
+                        # gone again already, its removal is reported separately
+                        pass
+
+                changes.add(path)
+
+    def wait(self, debounce: float) -> set[Path]:
+        select.select([self.fd], [], [])
+
+        changes: set[Path] = set()
+        while True:
+            changes |= self.read_events()
+
+            ready, _, _ = select.select([self.fd], [], [], debounce)
+            if not ready:
+                return changes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(Watcher):
+    # ==============================================================================================
+    # Fallback for platforms without inotify, or trees with more directories than
+    # the inotify watch limit allows. Compares size and mtime of every file each `interval`.
+    # ==============================================================================================
+    def __init__(self, roots: list[Path], interval: float = 1.0):
+        super().__init__(roots)
+
+        self.interval: float = interval
+        self.state: dict[Path, tuple[int, int]] = self.snapshot()
+
+    def snapshot(self) -> dict[Path, tuple[int, int]]:
+        state: dict[Path, tuple[int, int]] = {}
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+
+                for filename in filenames:
+                    path = Path(dirpath) / filename
+                    try:
+                        st = path.stat()
+                    except OSError:
+                        continue
+
+                    state[path] = (st.st_size, st.st_mtime_ns)
+
+        return state
+
+    def poll(self) -> set[Path]:
+        state = self.snapshot()
+        changes = {path for path in state.keys() | self.state.keys()
+                   if state.get(path) != self.state.get(path)}
+        self.state = state
+
+        return changes
+
+    def wait(self, debounce: float) -> set[Path]:
+        changes: set[Path] = set()
+        while not changes:
+            time.sleep(self.interval)
+            changes = self.poll()
+
+        while True:
+            time.sleep(debounce)
+            burst = self.poll()
+            if not burst:
+                return changes
+
+            changes |= burst
+
+
+# Watch `roots` with inotify where possible, polling otherwise
+def create_watcher(roots: list[Path], poll: bool = False) -> Watcher:
+    if sys.platform == 'linux' and not poll:
+        try:
+            return InotifyWatcher(roots)
+        except OSError as e:
+            # ======================================================================================
+            # Out of watches (ENOSPC) or inotify instances (EMFILE)
+            # ======================================================================================
+            if e.errno not in (errno.ENOSPC, errno.EMFILE, errno.ENOSYS):
+                raise
+
+    return PollingWatcher(roots)
+
+
+# Dependencies whose sources contain any of `paths`, the innermost one for nested sources
+def changed_deps(paths: set[Path], deps: dict[str, Dependency]) -> set[str]:
+    sources = sorted(((dep.source_dir, name) for name, dep in deps.items()),
+                     key=lambda entry: len(entry[0].parts), reverse=True)
+
+    changed: set[str] = set()
+    for path in paths:
+        for source_dir, name in sources:
+            if path == source_dir or source_dir in path.parents:
+                changed.add(name)
+                break
+
+    return changed
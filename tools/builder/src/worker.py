@@ -0,0 +1,248 @@
+from utils.types import BuildOptions, Dependency, DependencySpec
+from utils.manifest import Manifest, toolchain_fingerprint
+from utils.artifacts import cache_home
+from utils.bundle import pack, unpack
+from utils.registry import create_builder
+from utils.remote import (HEARTBEAT, IDLE_TIMEOUT, REMOTE_OPTIONS, Channel, bundle_digest, bundle_suffix,
+                          extract_snapshot, listen, received_bundle)
+
+from build import run_build
+
+from classopt import classopt, config
+
+from dataclasses import asdict
+from pathlib import Path
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+
+
+@classopt(default_long=True)
+class Opt:
+    # Describes launch parameters
+
+    listen: str = 'tcp://127.0.0.1:7878'  # Address to accept builds on, tcp://host:port or unix:///path
+    root_path: str = ''  # Scratch space for sources and builds, defaults to ~/.cache/template_cpp-worker
+    slots: int = 1  # Builds run at the same time
+    jobs: int = config(long=True, default=os.cpu_count() or 1)  # CPUs shared by the running builds
+
+
+class ChannelProgress():
+    # ==============================================================================================
+    # Stands in for the progress queue of `builders.common.Progress`, relaying the builder's
+    # messages to the coordinator. A coordinator that went away doesn't fail the build.
+    # ==============================================================================================
+    def __init__(self, channel: Channel):
+        self.channel: Channel = channel
+
+    def put(self, message: tuple):
+        _, text, persistent = message
+        try:
+            self.channel.send({'type': 'progress', 'text': text, 'persistent': persistent})
+        except OSError:
+            pass
+
+
+class Worker():
+    # ==============================================================================================
+    # Builds dependencies for coordinators, see `utils.remote.WorkerPool` for the protocol.
+    #
+    # Every dependency gets a project of its own below `root/projects/<name>`, which is kept
+    # between builds: sources are only sent when their fingerprint changed, required outputs
+    # when their manifest key changed, and the CMake build trees rebuild only what changed.
+    # ==============================================================================================
+    def __init__(self, root: Path, slots: int, jobs: int):
+        self.root: Path = root
+        self.slots: int = max(1, slots)
+        self.jobs: int = max(1, jobs)
+        self.toolchain: str = toolchain_fingerprint()
+
+        self.running: int = 0
+        self.lock = threading.Lock()
+        self.projects: dict[str, threading.Lock] = {}
+
+    def serve(self, address: str):
+        server: socket.socket = listen(address)
+        print(f'worker listening on {address} with {self.slots} slots, root \'{str(self.root)}\'')
+
+        try:
+            while True:
+                sock, _ = server.accept()
+                sock.settimeout(IDLE_TIMEOUT)
+                threading.Thread(target=self.handle, args=(Channel(sock),), daemon=True).start()
+        finally:
+            server.close()
+            if server.family == getattr(socket, 'AF_UNIX', None):
+                Path(server.getsockname()).unlink(missing_ok=True)
+
+    def handle(self, channel: Channel):
+        with channel:
+            try:
+                message = channel.recv()
+                if message.get('type') == 'status':
+                    channel.send({'type': 'status', 'running': self.running,
+                                  'slots': self.slots, 'toolchain': self.toolchain})
+                elif message.get('type') == 'build':
+                    self.build(channel, message)
+            except (OSError, ConnectionError) as e:
+                print(f'connection failed: {e}', file=sys.stderr)
+
+    def build(self, channel: Channel, message: dict):
+        name = message['name']
+
+        with self.lock:
+            busy = self.running >= self.slots or message['toolchain'] != self.toolchain
+            if not busy:
+                self.running += 1
+                project_lock = self.projects.setdefault(name, threading.Lock())
+
+        if busy:
+            channel.send({'type': 'busy'})
+            return
+
+        print(f'[{name.upper()}]: building {message["key"][:12]}')
+        try:
+            with project_lock, tempfile.TemporaryDirectory(prefix='builder-worker-') as tmp:
+                self.build_project(channel, message, self.root / 'projects' / name, Path(tmp))
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def build_project(self, channel: Channel, message: dict, project: Path, tmp: Path):
+        name = message['name']
+        deps: dict[str, Dependency] = {
+            n: Dependency.create(n, project, DependencySpec(**spec)) for n, spec in message['specs'].items()}
+
+        for dep in deps.values():
+            if project.resolve() not in dep.source_dir.resolve().parents:
+                raise ConnectionError(f'[{dep.name.upper()}]: sources outside of the project')
+
+        # ==========================================================================================
+        # Ask for whatever changed since the last build of the dependency
+        # ==========================================================================================
+        sources = [n for n, fingerprint in message['sources'].items()
+                   if self.snapshot_fingerprint(project, n) != fingerprint]
+
+        outputs: list[str] = []
+        for n, key in message['outputs'].items():
+            current = Manifest.load(deps[n].manifest_path)
+            if current is None or current.key() != key:
+                outputs.append(n)
+
+        channel.send({'type': 'need', 'sources': sources, 'outputs': outputs})
+
+        for _ in range(len(sources) + len(outputs)):
+            blob = tmp / 'blob'
+            received = channel.recv_file(blob)
+            dep = deps[received['name']]
+
+            if received['kind'] == 'source':
+                self.replace_sources(project, dep, blob, received['fingerprint'])
+            elif not unpack(received_bundle(blob, dep.name, received), dep, received['key']):
+                raise ConnectionError(f'[{dep.name.upper()}]: received a corrupt bundle')
+
+        # ==========================================================================================
+        # Build the way the coordinator would have, keeping it posted while the build runs
+        # ==========================================================================================
+        dep = deps[name]
+        options = BuildOptions(cpus=max(1, self.jobs // self.slots), progress=ChannelProgress(channel),
+                               **{option: message['options'][option] for option in REMOTE_OPTIONS})
+        builder = create_builder(dep.spec, project, deps, options)
+
+        for output in (dep.target_build_dir, dep.target_include_dir):
+            if output.is_symlink():
+                output.unlink()
+            elif output.exists():
+                shutil.rmtree(output)
+        dep.manifest_path.unlink(missing_ok=True)
+
+        manifest = Manifest(**message['manifest'])
+        builder.reset_log()
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self.heartbeat, args=(channel, done), daemon=True)
+        heartbeat.start()
+
+        error: str | None = None
+        try:
+            if builder.configuration() != manifest.configuration:
+                raise RuntimeError(f'[{name.upper()}]: worker would build another configuration')
+
+            run_build(builder)
+        except RuntimeError as re:
+            error = str(re)
+        finally:
+            done.set()
+            heartbeat.join()
+            builder.report_memory()
+
+        bundle: Path | None = None
+        if error is None:
+            builder.record_artifacts()
+            manifest.save(dep.manifest_path)
+            bundle = pack(dep, message['key'], tmp / 'out')
+
+        print(f'[{name.upper()}]: {"failed" if error else "done"}')
+
+        # ==========================================================================================
+        # Result first, then the log and the outputs
+        # ==========================================================================================
+        channel.send({'type': 'result', 'ok': error is None, 'error': error,
+                      'spans': [asdict(span) for span in builder.tracer.spans]})
+        channel.send_file(builder.log_path)
+        if bundle is not None:
+            channel.send_file(bundle, suffix=bundle_suffix(bundle), digest=bundle_digest(bundle))
+
+    def heartbeat(self, channel: Channel, done: threading.Event):
+        while not done.wait(HEARTBEAT):
+            try:
+                channel.send({'type': 'alive'})
+            except OSError:
+                return
+
+    # Fingerprint of the sources of `name` in `project`, empty if there are none
+    @staticmethod
+    def snapshot_fingerprint(project: Path, name: str) -> str:
+        try:
+            return (project / '.snapshots' / name).read_text()
+        except OSError:
+            return ''
+
+    # Swap the sources of `dep` for a received snapshot. Files keep their mtimes,
+    # so build trees only rebuild what actually changed.
+    @staticmethod
+    def replace_sources(project: Path, dep: Dependency, snapshot: Path, fingerprint: str):
+        marker = project / '.snapshots' / dep.name
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.unlink(missing_ok=True)
+
+        tmp = dep.source_dir.with_name(f'.{dep.source_dir.name}.snapshot')
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        extract_snapshot(snapshot, tmp)
+
+        shutil.rmtree(dep.source_dir, ignore_errors=True)
+        os.replace(tmp, dep.source_dir)
+        marker.write_text(fingerprint)
+
+
+def main():
+    opt = Opt.from_args()
+    root = Path(opt.root_path or cache_home() / 'template_cpp-worker').resolve()
+
+    try:
+        Worker(root, opt.slots, opt.jobs).serve(opt.listen)
+    except RuntimeError as re:
+        print(re, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())